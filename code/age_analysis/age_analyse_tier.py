@@ -7,11 +7,15 @@ significant.
 """
 
 import numpy as np
-import pandas as pd
 from scipy import stats
 import matplotlib.pyplot as plt
+import sys
 from pathlib import Path
 
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.streaming import streaming_player_stats  # noqa: E402
+
 # Originally the in- and output was stored within a directory next to the code,
 # but it was decided to seperate data and code.
 CSV_DIR = "../../data/tennis_atp_data/altered_data/age_analysis"
@@ -32,28 +36,16 @@ def main():
         )
         return 1
     init_out_dir()
-    df = pd.read_csv(path)
 
     # We are looking for the total mean per tier, so winners and losers should
-    # be combined.
-    winners = df[["year", "tier", "winner_id", "winner_age"]].rename(
-        columns={"winner_id": "id", "winner_age": "age"}
-    )
-    losers = df[["year", "tier", "loser_id", "loser_age"]].rename(
-        columns={"loser_id": "id", "loser_age": "age"}
-    )
-    ages = pd.concat([winners, losers], ignore_index=True)
-
-    # Not dropping duplicates would cause winners to be overcounted, creating
-    # a bias. We only care what heights exist per tier, not how they performed.
+    # be combined. Every player only counts once per year-tier group, not
+    # dropping duplicates would cause winners to be overcounted, creating a
+    # bias. We only care what ages exist per tier, not how they performed.
     # For this analysis at least.
-    ages = ages.drop_duplicates(subset=["year", "tier", "id"])
-
-    # Gets the ages into separate year-tier groups.
-    groups = ages.groupby(["year", "tier"])["age"]
-    # Creates an out dataframe with the number of ages per group, their mean and
-    # std. reset_index Turns it into normal columns.
-    out = groups.agg(n="count", mean="mean", std="std").reset_index()
+    # The matches are read in chunks, so the memory use stays the same no
+    # matter how many tiers are in the data. out has the number of ages per
+    # group, their mean and std.
+    out = streaming_player_stats(path, "age", group_cols=("year", "tier"))
 
     # The CI is computed using the Student's t-distribution:
     # https://en.wikipedia.org/wiki/Confidence_interval
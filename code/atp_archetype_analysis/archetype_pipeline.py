@@ -0,0 +1,140 @@
+"""
+This file contains the entire archetype data cleaning (steps 1 to 6 of the
+README) as a single run. The stages used to hand their results to each other
+through clean_matches.csv, matches_with_bins.csv, matches_recent.csv and
+archetype_matchups.csv, which meant writing and reading the same few million
+rows five times over. Here every stage gets the DataFrame of the previous one
+directly, the raw match files are read only once (the match lengths per year
+are collected in a DurationHistogram during that same scan), and the frames
+are kept compact: int32 ids, float32 ranks and minutes and categoricals for
+the names and bins. Only the final artefacts are saved:
+    - match_durations.csv(the histograms, to rebin without the match files)
+    - match_length_bins_by_year.csv
+    - player_archetypes.csv
+    - archetype_matchups.csv
+    - matches_with_archetypes.csv
+    - matchup_cube.pkl(see matchup_cube.py)
+
+With FORMAT = "pickle" they are saved as .pkl files next to the csv files as
+well, which load_artefact() prefers if it is the newer one. Pickle is used
+because it needs nothing besides pandas.
+
+The separate scripts still work as before, this only chains their functions.
+"""
+
+import os
+import time
+import pandas as pd
+
+from match_length_bins_by_year import DurationHistogram, BIN_RULE
+from clean_matches import load_clean_matches, explode_win_loss
+from label_matches_by_bin import apply_length_bins
+from build_player_archetypes import (
+    filter_recent_matches,
+    filter_player_counts,
+    compute_player_bin_stats,
+    assign_archetypes,
+)
+from build_archetypes_matchups import build_matchups
+from data_cleaning_for_model import merge_archetypes
+from matchup_cube import MatchupCube, add_cube_columns
+
+DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
+# "csv" or "pickle", with pickle the csv files are still written so the other
+# scripts and the atp_model keep working.
+FORMAT = "csv"
+
+
+def compact(df):
+    """
+    Downcasts the player level columns, roughly halving the memory of the
+    frames that are passed between the stages. The values are unchanged, the
+    ids and years fit in int32/int16 and the ranks and minutes are whole
+    numbers well within float32.
+    """
+    df = df.copy()
+    for col in ["player_id", "opponent_id"]:
+        if col in df:
+            df[col] = df[col].astype("int32")
+    for col in ["player_rank", "opponent_rank", "minutes"]:
+        if col in df:
+            df[col] = df[col].astype("float32")
+    for col in ["player_name", "opponent_name", "surface", "length_bin"]:
+        if col in df:
+            df[col] = df[col].astype("category")
+    if "year" in df:
+        df["year"] = df["year"].astype("int16")
+    if "won" in df:
+        df["won"] = df["won"].astype("int8")
+    return df
+
+
+def run_pipeline():
+    """
+    Runs all stages in memory. Returns a dict from artefact name to
+    DataFrame, or MatchupCube for the cube.
+    """
+    print("Loading ATP matches...")
+    durations = DurationHistogram()
+    clean = load_clean_matches(durations=durations)
+    bins = durations.summary(BIN_RULE)
+
+    print("Expanding into player-level rows and applying the length bins...")
+    matches = compact(explode_win_loss(clean))
+    matches = apply_length_bins(matches, bins)
+    matches["length_bin"] = matches["length_bin"].astype("category")
+
+    print("Building player archetypes...")
+    recent = filter_recent_matches(matches)
+    stats = compute_player_bin_stats(filter_player_counts(recent).copy())
+    stats["archetype"] = assign_archetypes(stats)
+
+    print("Building archetype matchups...")
+    matchups = build_matchups(recent, stats)
+    with_archetypes = merge_archetypes(recent, matchups)
+
+    print("Building the matchup cube...")
+    cube = MatchupCube.build(add_cube_columns(with_archetypes))
+
+    return {
+        "match_durations": durations.to_frame(),
+        "match_length_bins_by_year": bins,
+        "player_archetypes": stats,
+        "archetype_matchups": matchups,
+        "matches_with_archetypes": with_archetypes,
+        "matchup_cube": cube,
+    }
+
+
+def save_artefacts(artefacts, data_path=DATA_PATH, fmt=FORMAT):
+    for name, df in artefacts.items():
+        if isinstance(df, MatchupCube):
+            print(f"Saving: {data_path}{name}.pkl")
+            df.save(f"{data_path}{name}.pkl")
+            continue
+        print(f"Saving: {data_path}{name}.csv")
+        df.to_csv(f"{data_path}{name}.csv", index=False)
+        if fmt == "pickle":
+            print(f"Saving: {data_path}{name}.pkl")
+            df.to_pickle(f"{data_path}{name}.pkl")
+
+
+def load_artefact(name, data_path=DATA_PATH):
+    """
+    Loads e.g. "archetype_matchups", from the .pkl file if there is one that
+    is at least as new as the csv, else from the csv. So an old .pkl is never
+    used after the csv was rebuilt by one of the separate scripts.
+    """
+    csv_path = f"{data_path}{name}.csv"
+    pkl_path = f"{data_path}{name}.pkl"
+    if os.path.exists(pkl_path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(pkl_path) >= os.path.getmtime(csv_path)
+    ):
+        return pd.read_pickle(pkl_path)
+    return pd.read_csv(csv_path)
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    save_artefacts(run_pipeline())
+    print(f"Done in {time.perf_counter() - start:.1f}s.")
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
@@ -5,6 +6,8 @@ DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
 N_LAST_MATCHES = 100
 MIN_MATCHES = 50
 MIN_BIN_MATCHES = 10
+# The order of the bins in the arrays of player_bin_counts().
+BINS = ["short", "medium", "long"]
 
 
 def filter_recent_matches(df):
@@ -18,35 +21,76 @@ def filter_player_counts(df):
     return df[df["player_id"].isin(eligible)]
 
 
-def compute_player_bin_stats(df):
-    df["length_bin"] = df["length_bin"].astype(str).str.strip().str.lower()
-
-    grouped = df.groupby(["player_id", "length_bin"]).agg(
-        matches=("won", "size"),
-        wins=("won", "sum")
-    ).reset_index()
-
-    grouped["winrate"] = grouped["wins"] / grouped["matches"]
+def player_bin_counts(player_codes, bin_codes, won, n_players, n_bins=3):
+    """
+    player_codes - array
+        The player of every row as a code from 0 to n_players - 1.
+    bin_codes - array
+        The length bin of every row as a code from 0 to n_bins - 1.
+    won - array
+        0/1 of every row.
+
+    Returns two (n_players, n_bins) arrays with the matches and wins per
+    player per bin, counted with one bincount over player * n_bins + bin.
+    """
+    index = np.asarray(player_codes) * n_bins + np.asarray(bin_codes)
+    size = n_players * n_bins
+    matches = np.bincount(index, minlength=size).reshape(n_players, n_bins)
+    wins = np.bincount(index, weights=won, minlength=size).reshape(n_players, n_bins)
+    return matches, wins
+
+
+def archetypes_from_counts(matches, wins, bins=BINS):
+    """
+    The vectorized version of the archetype rule, for the (n_players,
+    len(bins)) arrays of player_bin_counts(). A bin without matches has a
+    winrate of 0. Returns an array with the archetype of every player.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        winrate = np.where(matches > 0, wins / matches, 0.0)
+    wr_s, wr_m, wr_l = (winrate[:, bins.index(b)] for b in ["short", "medium", "long"])
+    m_s = matches[:, bins.index("short")]
+    m_l = matches[:, bins.index("long")]
+
+    sprinter = (wr_s >= wr_m) & (wr_s >= wr_l) & (m_s >= MIN_BIN_MATCHES)
+    endurance = (wr_l >= wr_m) & (wr_l >= wr_s) & (m_l >= MIN_BIN_MATCHES)
+    # Sprinter is checked first, so it wins a tie with Endurance.
+    return np.where(sprinter, "Sprinter", np.where(endurance, "Endurance", "Balanced"))
 
-    pivot = grouped.pivot(index="player_id", columns="length_bin",
-                          values=["matches", "wins", "winrate"])
-    pivot.columns = [f"{m}_{b}" for m, b in pivot.columns]
-    pivot = pivot.fillna(0).reset_index()
-    return pivot
 
-
-def assign_archetype(row):
-    wr_s = row.get("winrate_short", 0.0)
-    wr_m = row.get("winrate_medium", 0.0)
-    wr_l = row.get("winrate_long", 0.0)
-    m_s = int(row.get("matches_short", 0))
-    m_l = int(row.get("matches_long", 0))
-
-    if wr_s >= wr_m and wr_s >= wr_l and m_s >= MIN_BIN_MATCHES:
-        return "Sprinter"
-    if wr_l >= wr_m and wr_l >= wr_s and m_l >= MIN_BIN_MATCHES:
-        return "Endurance"
-    return "Balanced"
+def compute_player_bin_stats(df):
+    """
+    The matches, wins and winrate per player per length bin, one row per
+    player with a column per statistic and bin, e.g. matches_short. Only the
+    bins that occur are included, in alphabetical order, and a player without
+    matches in a bin gets 0 for it.
+    """
+    length_bin = df["length_bin"].astype(str).str.strip().str.lower().to_numpy()
+    players, player_codes = np.unique(df["player_id"].to_numpy(), return_inverse=True)
+    bins, bin_codes = np.unique(length_bin, return_inverse=True)
+
+    matches, wins = player_bin_counts(player_codes, bin_codes,
+                                      df["won"].to_numpy(dtype=float), len(players), len(bins))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        winrate = np.where(matches > 0, wins / matches, 0.0)
+
+    stats = pd.DataFrame({"player_id": players})
+    for name, values in [("matches", matches), ("wins", wins), ("winrate", winrate)]:
+        for i, b in enumerate(bins):
+            stats[f"{name}_{b}"] = values[:, i].astype(float)
+    return stats
+
+
+def assign_archetypes(stats):
+    """
+    The archetype of every row of compute_player_bin_stats(), a bin that is
+    missing from stats counts as 0 matches.
+    """
+    matches = np.column_stack([stats.get(f"matches_{b}", pd.Series(0.0, index=stats.index))
+                               for b in BINS])
+    wins = np.column_stack([stats.get(f"wins_{b}", pd.Series(0.0, index=stats.index))
+                            for b in BINS])
+    return archetypes_from_counts(matches, wins)
 
 
 if __name__ == "__main__":
@@ -65,7 +109,7 @@ if __name__ == "__main__":
     stats = compute_player_bin_stats(df)
 
     print("Assigning archetypes…")
-    stats["archetype"] = stats.apply(assign_archetype, axis=1)
+    stats["archetype"] = assign_archetypes(stats)
 
     print(f"Saving: {DATA_PATH}player_archetypes.csv")
     stats.to_csv(DATA_PATH + "player_archetypes.csv", index=False)
@@ -2,15 +2,25 @@ import pandas as pd
 import glob
 import re
 import os
+import sys
+from pathlib import Path
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.match_keys import match_keys  # noqa: E402
 
 DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
 
 
 def load_clean_matches(path_pattern="../../data/tennis_atp_data/unaltered_data/*",
-                       regex=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$"):
+                       regex=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$",
+                       durations=None):
     """
     Loads essential ATP match columns including player ranks.
     Returns a raw clean dataset before expanding winner/loser rows.
+
+    If durations, a DurationHistogram of match_length_bins_by_year.py, is
+    given the minutes of every file are added to it during the same scan.
     """
 
     pattern = re.compile(regex)
@@ -27,6 +37,7 @@ def load_clean_matches(path_pattern="../../data/tennis_atp_data/unaltered_data/*
         year = int(m.group(1))
 
         df = pd.read_csv(fn, usecols=[
+            "tourney_id", "match_num", "surface",
             "winner_id", "winner_name", "winner_rank",
             "loser_id", "loser_name", "loser_rank",
             "minutes"
@@ -37,9 +48,13 @@ def load_clean_matches(path_pattern="../../data/tennis_atp_data/unaltered_data/*
         # Clean minutes
         df["minutes"] = pd.to_numeric(df["minutes"], errors="coerce")
         df = df.dropna(subset=["minutes"])
+        if durations is not None:
+            durations.add(year, df["minutes"])
 
-        # Unique match identifier
-        df["match_id"] = df.index.astype(str) + "_" + str(year)
+        # Unique match identifier, an int64 that is the same in every table
+        # that has the tourney_id and match_num, see code/shared/match_keys.py.
+        df["match_id"] = match_keys(df["tourney_id"], df["match_num"], "atp", "main")
+        df = df.drop(columns=["tourney_id", "match_num"])
 
         dfs.append(df)
 
@@ -57,6 +72,7 @@ def explode_win_loss(clean_df):
     winners = pd.DataFrame({
         "match_id": clean_df["match_id"],
         "year": clean_df["year"],
+        "surface": clean_df["surface"],
 
         "player_id": clean_df["winner_id"],
         "player_name": clean_df["winner_name"],
@@ -73,6 +89,7 @@ def explode_win_loss(clean_df):
     losers = pd.DataFrame({
         "match_id": clean_df["match_id"],
         "year": clean_df["year"],
+        "surface": clean_df["surface"],
 
         "player_id": clean_df["loser_id"],
         "player_name": clean_df["loser_name"],
@@ -1,14 +1,117 @@
+import numpy as np
 import pandas as pd
 import glob
 import re
 import os
 
 DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
+DURATIONS_CSV = "match_durations.csv"
+# "std" for the mean -+ 1 std thresholds of the analysis, "quantile" for
+# thresholds at the QUANTILES of the match lengths of a year.
+BIN_RULE = "std"
+QUANTILES = (1 / 3, 2 / 3)
+
+
+class DurationHistogram:
+    """
+    The amount of matches per whole minute per year. The minutes in the data
+    are whole minutes, so this is an exact summary of all match lengths: the
+    mean, std and any quantile per year can be computed from it, and two
+    histograms can be merged by adding them. It is filled during the same
+    scan over the match files as load_clean_matches(), so changing the binning
+    rule does not require reading those files again.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, year, minutes):
+        minutes = pd.to_numeric(pd.Series(minutes), errors="coerce").dropna()
+        minutes = np.rint(minutes.to_numpy()).astype(np.int64)
+        if len(minutes) == 0:
+            return
+        counts = np.bincount(minutes)
+        old = self.counts.get(year, np.zeros(0, dtype=np.int64))
+        size = max(len(old), len(counts))
+        self.counts[year] = (np.pad(old, (0, size - len(old)))
+                             + np.pad(counts, (0, size - len(counts))))
+
+    @classmethod
+    def from_matches(cls, df):
+        """
+        From a DataFrame with a year and minutes column.
+        """
+        hist = cls()
+        for year, group in df.groupby("year"):
+            hist.add(year, group["minutes"])
+        return hist
+
+    def to_frame(self):
+        rows = []
+        for year, counts in sorted(self.counts.items()):
+            minutes = np.flatnonzero(counts)
+            rows.append(pd.DataFrame({"year": year, "minutes": minutes,
+                                      "count": counts[minutes]}))
+        return pd.concat(rows, ignore_index=True)
+
+    @classmethod
+    def from_frame(cls, df):
+        hist = cls()
+        for year, group in df.groupby("year"):
+            counts = np.zeros(group["minutes"].max() + 1, dtype=np.int64)
+            counts[group["minutes"].to_numpy()] = group["count"].to_numpy()
+            hist.counts[year] = counts
+        return hist
+
+    def summary(self, rule=BIN_RULE, quantiles=QUANTILES):
+        """
+        The bins per year, with rule "std" the thresholds are the mean -+ 1
+        std, with "quantile" they are the quantiles of the match lengths.
+        """
+        results = []
+        for year, counts in sorted(self.counts.items()):
+            minutes = np.arange(len(counts))
+            total_matches = counts.sum()
+            avg = (counts * minutes).sum() / total_matches
+            std = np.sqrt((counts * (minutes - avg) ** 2).sum() / (total_matches - 1))
+
+            if rule == "std":
+                short_t = avg - std
+                long_t = avg + std
+            elif rule == "quantile":
+                # The smallest minute with at least that fraction of the
+                # matches at or below it.
+                cum = np.cumsum(counts)
+                short_t, long_t = (
+                    float(np.searchsorted(cum, q * total_matches)) for q in quantiles
+                )
+            else:
+                raise ValueError(f"Unknown rule {rule}, expected 'std' or 'quantile'.")
+
+            # The same (short, medium, long] edges as pd.cut.
+            short_count = counts[minutes <= short_t].sum()
+            long_count = counts[minutes > long_t].sum()
+            medium_count = total_matches - short_count - long_count
+
+            results.append({
+                "year": year,
+                "avg_minutes": avg,
+                "std_minutes": std,
+                "short_threshold": short_t,
+                "long_threshold": long_t,
+                "short_count": short_count,
+                "medium_count": medium_count,
+                "long_count": long_count,
+                "total_matches": total_matches
+            })
+
+        return pd.DataFrame(results).sort_values("year")
 
 
 def compute_match_length_bins(
     path_pattern="../../data/tennis_atp_data/unaltered_data/*",
     regex_pattern=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$",
+    rule=BIN_RULE,
 ):
     """
     For each ATP match file:
@@ -18,10 +121,34 @@ def compute_match_length_bins(
     - count matches in each bin
     Returns summary DataFrame.
     """
+    return scan_durations(path_pattern, regex_pattern).summary(rule)
+
 
+def is_current(path,
+               path_pattern="../../data/tennis_atp_data/unaltered_data/*",
+               regex_pattern=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$"):
+    """
+    True if path exists and is at least as new as every match file, so e.g. a
+    match_durations.csv of before the match files were updated is not used.
+    """
+    if not os.path.exists(path):
+        return False
+    file_pattern = re.compile(regex_pattern)
+    mtimes = [os.path.getmtime(fn) for fn in glob.glob(path_pattern)
+              if file_pattern.search(os.path.basename(fn))]
+    return os.path.getmtime(path) >= max(mtimes, default=0)
+
+
+def scan_durations(
+    path_pattern="../../data/tennis_atp_data/unaltered_data/*",
+    regex_pattern=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$",
+):
+    """
+    Reads only the minutes of every match file into a DurationHistogram.
+    """
     file_pattern = re.compile(regex_pattern)
     files = glob.glob(path_pattern)
-    results = []
+    hist = DurationHistogram()
 
     for fn in files:
         m = file_pattern.search(os.path.basename(fn))
@@ -37,48 +164,28 @@ def compute_match_length_bins(
             print(f"Skipping {fn}: missing 'minutes'")
             continue
 
-        df["minutes"] = pd.to_numeric(df["minutes"], errors="coerce")
-        df = df.dropna(subset=["minutes"])
-
-        if df.empty:
-            continue
+        hist.add(year, df["minutes"])
 
-        avg = df["minutes"].mean()
-        std = df["minutes"].std()
+    return hist
 
-        short_t = avg - std
-        long_t = avg + std
 
-        # Classify each match
-        df["bin"] = pd.cut(
-            df["minutes"],
-            bins=[-float("inf"), short_t, long_t, float("inf")],
-            labels=["short", "medium", "long"]
-        )
-
-        short_count = (df["bin"] == "short").sum()
-        medium_count = (df["bin"] == "medium").sum()
-        long_count = (df["bin"] == "long").sum()
-        total_matches = len(df)
-
-        results.append({
-            "year": year,
-            "avg_minutes": avg,
-            "std_minutes": std,
-            "short_threshold": short_t,
-            "long_threshold": long_t,
-            "short_count": short_count,
-            "medium_count": medium_count,
-            "long_count": long_count,
-            "total_matches": total_matches
-        })
-
-    summary = pd.DataFrame(results).sort_values("year")
-    return summary
+def summarize_match_lengths(df, rule=BIN_RULE):
+    """
+    The bins per year of a DataFrame with a year and minutes column, for
+    matches that were already loaded.
+    """
+    return DurationHistogram.from_matches(df).summary(rule)
 
 
 if __name__ == "__main__":
-    summary = compute_match_length_bins()
+    # The histograms saved by archetype_pipeline.py are enough to rebin, the
+    # match files are only read if they are not there or older than them.
+    if is_current(DATA_PATH + DURATIONS_CSV):
+        print(f"Loading: {DATA_PATH}{DURATIONS_CSV}")
+        hist = DurationHistogram.from_frame(pd.read_csv(DATA_PATH + DURATIONS_CSV))
+    else:
+        hist = scan_durations()
+    summary = hist.summary(BIN_RULE)
 
     print("\n=== Match Duration Bins by Year ===")
     print(summary)
@@ -0,0 +1,182 @@
+"""
+This file contains a precomputed cube of the wins and matches per
+combination of player archetype, opponent archetype, surface, year, rank
+bucket and tier. It is built once from the player level matches with a single
+bincount over the combined integer codes of all dimensions, after which a
+heatmap or win rate table is a slice and/or a sum over the other dimensions
+of two small arrays, instead of filtering all matches again.
+
+    cube = load_cube()
+    cube.sel(surface="Clay").matrix("player_archetype", "opponent_archetype")
+    cube.rollup("year").to_frame()
+
+archetype_pipeline.py saves the cube as matchup_cube.pkl. If that is not
+there it is built from archetype_matchups.csv, which only has the
+archetypes and ranks, so the surface, year and tier are not available then.
+"""
+
+import pickle
+import os
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.match_keys import TIERS, HASH_BITS, MATCH_NUM_BITS  # noqa: E402
+
+DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
+CUBE_PKL = "matchup_cube.pkl"
+DIMS = ["player_archetype", "opponent_archetype", "surface", "year", "rank_bucket", "tier"]
+ARCHETYPES = ["Sprinter", "Balanced", "Endurance"]
+# Buckets of the rank of the player, unranked players get their own "NR"
+# bucket.
+RANK_BUCKETS = [0, 10, 50, 100, 250, np.inf]
+
+
+def add_cube_columns(df):
+    """
+    Adds the rank_bucket of the player_rank and, if there is a match_id, the
+    tier that is stored in its bits (see code/shared/match_keys.py).
+    """
+    df = df.copy()
+    rank = pd.to_numeric(df["player_rank"], errors="coerce")
+    df["rank_bucket"] = pd.cut(rank, RANK_BUCKETS).astype(str).replace("nan", "NR")
+    if "match_id" in df:
+        tier_bits = (df["match_id"].to_numpy(dtype=np.int64) >> (HASH_BITS + MATCH_NUM_BITS)) & 3
+        names = {code: tier for tier, code in TIERS.items()}
+        df["tier"] = [names[code] for code in tier_bits]
+    return df
+
+
+def _levels(values, dim):
+    present = pd.unique(values.dropna())
+    if dim in ["player_archetype", "opponent_archetype"]:
+        return [a for a in ARCHETYPES if a in present] + sorted(
+            a for a in present if a not in ARCHETYPES)
+    if dim == "rank_bucket":
+        order = [str(b) for b in pd.cut([], RANK_BUCKETS).categories] + ["NR"]
+        return [b for b in order if b in present]
+    return sorted(present)
+
+
+class MatchupCube:
+    """
+    wins and matches are arrays with one axis per dimension in dims, levels
+    has the values of every dimension in the order of its axis.
+    """
+
+    def __init__(self, dims, levels, wins, matches):
+        self.dims = list(dims)
+        self.levels = {d: list(levels[d]) for d in self.dims}
+        self.wins = wins
+        self.matches = matches
+
+    @classmethod
+    def build(cls, df, dims=DIMS, won="won"):
+        """
+        df - DataFrame
+            Player level matches with a 0/1 won column and a column per
+            dimension. Rows with a missing value in one of them are left out.
+        dims - list
+            The dimensions, those that are not in df are skipped.
+        """
+        dims = [d for d in dims if d in df]
+        df = df.dropna(subset=[*dims, won])
+        levels = {d: _levels(df[d], d) for d in dims}
+        shape = tuple(len(levels[d]) for d in dims)
+        codes = [pd.Categorical(df[d], categories=levels[d]).codes for d in dims]
+        # One flat index per combination of levels.
+        index = np.ravel_multi_index(codes, shape) if dims else np.zeros(len(df), dtype=int)
+        size = int(np.prod(shape))
+        matches = np.bincount(index, minlength=size).reshape(shape)
+        wins = np.bincount(index, weights=df[won].to_numpy(dtype=float),
+                           minlength=size).reshape(shape)
+        return cls(dims, levels, wins, matches)
+
+    def sel(self, **where):
+        """
+        Slices the cube, e.g. sel(surface="Clay", year=[2023, 2024]). A single
+        value drops the dimension, a list keeps it with only those levels.
+        """
+        wins, matches = self.wins, self.matches
+        dims, levels = list(self.dims), dict(self.levels)
+        for dim, value in where.items():
+            axis = dims.index(dim)
+            if isinstance(value, (list, tuple, range, np.ndarray)):
+                idx = [levels[dim].index(v) for v in value]
+                wins = np.take(wins, idx, axis=axis)
+                matches = np.take(matches, idx, axis=axis)
+                levels[dim] = list(value)
+            else:
+                idx = levels[dim].index(value)
+                wins = np.take(wins, idx, axis=axis)
+                matches = np.take(matches, idx, axis=axis)
+                dims.pop(axis)
+                del levels[dim]
+        return MatchupCube(dims, levels, wins, matches)
+
+    def rollup(self, *keep):
+        """
+        Sums over all dimensions that are not in keep, the result has the
+        dimensions in the order of keep.
+        """
+        drop = tuple(i for i, d in enumerate(self.dims) if d not in keep)
+        wins = self.wins.sum(axis=drop)
+        matches = self.matches.sum(axis=drop)
+        remaining = [d for d in self.dims if d in keep]
+        order = [remaining.index(d) for d in keep]
+        return MatchupCube(keep, self.levels, wins.transpose(order),
+                           matches.transpose(order))
+
+    def win_rate(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.matches > 0, self.wins / self.matches, np.nan)
+
+    def matrix(self, rows, cols):
+        """
+        The win rates as a DataFrame with the levels of rows as index and
+        those of cols as columns, NaN where there were no matches.
+        """
+        cube = self.rollup(rows, cols)
+        return pd.DataFrame(cube.win_rate(), index=cube.levels[rows],
+                            columns=cube.levels[cols])
+
+    def to_frame(self):
+        """
+        One row per combination with matches, with the wins, matches and
+        win_rate.
+        """
+        index = pd.MultiIndex.from_product([self.levels[d] for d in self.dims],
+                                           names=self.dims)
+        out = pd.DataFrame({"wins": self.wins.ravel(), "matches": self.matches.ravel()},
+                           index=index)
+        out["win_rate"] = out["wins"] / out["matches"]
+        return out[out["matches"] > 0].reset_index()
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def load_cube(data_path=DATA_PATH):
+    """
+    The cube of archetype_pipeline.py, or if that is missing or older than
+    archetype_matchups.csv, one built from that csv with only the archetype and
+    rank dimensions. Like archetype_pipeline.load_artefact(), so an old cube is
+    never used after the csv was rebuilt by one of the separate scripts.
+    """
+    pkl_path = data_path + CUBE_PKL
+    csv_path = data_path + "archetype_matchups.csv"
+    if os.path.exists(pkl_path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(pkl_path) >= os.path.getmtime(csv_path)
+    ):
+        return MatchupCube.load(pkl_path)
+    df = pd.read_csv(csv_path)
+    return MatchupCube.build(add_cube_columns(df))
@@ -0,0 +1,186 @@
+"""
+This file contains the as-of version of the player archetypes. The archetypes
+of build_player_archetypes.py use the last N_LAST_MATCHES matches of every
+player at the end of the data, so a match in 1995 can get an archetype that is
+based on matches of 2005. Used as a feature of the atp_model that means the
+model partly sees the future.
+
+Here the matches are streamed in chronological order and every player has a
+ring buffer with the length bin and result of their last N_LAST_MATCHES
+matches, plus the running matches and wins per bin of what is in the buffer.
+Before every match the counts of both players are taken, and only then is the
+match pushed into their buffers, overwriting their oldest match once the
+buffer is full. The archetype rule is applied to all those counts at once at
+the end, with the same archetypes_from_counts() and MIN_MATCHES as the
+original archetypes. The whole history takes a few seconds.
+
+The length bin thresholds are still those of the entire year of the match, so
+the average match length of that year is known in advance. That is not
+information about the players though.
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.match_keys import match_keys  # noqa: E402
+from match_length_bins_by_year import summarize_match_lengths  # noqa: E402
+from build_player_archetypes import (  # noqa: E402
+    N_LAST_MATCHES,
+    MIN_MATCHES,
+    BINS,
+    archetypes_from_counts,
+)
+
+DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
+OUT_CSV = "rolling_archetypes.csv"
+
+
+class ArchetypeHistory:
+    """
+    Ring buffers of the last window (length bin, won) results per player.
+    """
+
+    def __init__(self, window=N_LAST_MATCHES, n_bins=len(BINS)):
+        self.window = window
+        self.n_bins = n_bins
+        # player -> [bins, wons, next position, matches per bin, wins per bin]
+        self.players = {}
+
+    def _state(self, player):
+        state = self.players.get(player)
+        if state is None:
+            state = [[-1] * self.window, [0] * self.window, 0,
+                     [0] * self.n_bins, [0] * self.n_bins]
+            self.players[player] = state
+        return state
+
+    def counts(self, player):
+        """
+        The matches and wins per bin within the window of player so far.
+        """
+        state = self.players.get(player)
+        if state is None:
+            return [0] * self.n_bins, [0] * self.n_bins
+        return list(state[3]), list(state[4])
+
+    def push(self, player, length_bin, won):
+        """
+        Adds a result, length_bin is a code from 0 to n_bins - 1.
+        """
+        bins, wons, pos, matches, wins = state = self._state(player)
+        old = bins[pos]
+        # Once the buffer is full the oldest result falls out of the window.
+        if old >= 0:
+            matches[old] -= 1
+            wins[old] -= wons[pos]
+        bins[pos] = length_bin
+        wons[pos] = won
+        matches[length_bin] += 1
+        wins[length_bin] += won
+        state[2] = (pos + 1) % self.window
+
+
+def load_chronological_matches(
+    path_pattern="../../data/tennis_atp_data/unaltered_data/*",
+    regex=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$",
+):
+    """
+    Loads the same main tier matches as load_clean_matches() of
+    clean_matches.py, but with the tourney_id, tourney_date and match_num to
+    order them by, and including the matches without minutes. The match_id
+    is the same as that of load_clean_matches(). Returns them sorted by date,
+    tournament and match number.
+    """
+    pattern = re.compile(regex)
+    dfs = []
+    for fn in glob.glob(path_pattern):
+        m = pattern.search(os.path.basename(fn))
+        if not m:
+            continue
+        df = pd.read_csv(fn, usecols=["tourney_id", "tourney_date", "match_num",
+                                      "winner_id", "loser_id", "minutes"])
+        df["year"] = int(m.group(1))
+        df["minutes"] = pd.to_numeric(df["minutes"], errors="coerce")
+        df["match_id"] = match_keys(df["tourney_id"], df["match_num"], "atp", "main")
+        dfs.append(df)
+    df = pd.concat(dfs, ignore_index=True)
+    return df.sort_values(["tourney_date", "tourney_id", "match_num"],
+                          kind="stable").reset_index(drop=True)
+
+
+def length_bin_codes(df, df_bins):
+    """
+    The code of the length bin (index in BINS) of every match, using the same
+    thresholds as apply_length_bins(), and -1 for matches without minutes.
+    """
+    thresholds = df_bins.set_index("year")
+    short_t = df["year"].map(thresholds["short_threshold"]).to_numpy()
+    long_t = df["year"].map(thresholds["long_threshold"]).to_numpy()
+    minutes = df["minutes"].to_numpy()
+    codes = np.full(len(df), BINS.index("medium"))
+    codes[minutes < short_t] = BINS.index("short")
+    codes[minutes > long_t] = BINS.index("long")
+    codes[np.isnan(minutes)] = -1
+    return codes
+
+
+def rolling_archetypes(df, window=N_LAST_MATCHES, min_matches=MIN_MATCHES):
+    """
+    df - DataFrame
+        Chronologically sorted matches with winner_id, loser_id, year and
+        minutes, e.g. from load_chronological_matches().
+    window - int
+        The amount of most recent matches per player the archetype is based
+        on.
+    min_matches - int
+        Players with fewer matches within their window get no archetype (NaN),
+        like filter_player_counts() leaves them out.
+
+    Returns df with a winner_archetype and loser_archetype column, the
+    archetypes of both players as of right before the match. Matches without
+    minutes get archetypes but don't count towards them.
+    """
+    codes = length_bin_codes(df, summarize_match_lengths(df))
+    history = ArchetypeHistory(window)
+    n = len(df)
+    matches = np.zeros((2, n, len(BINS)))
+    wins = np.zeros((2, n, len(BINS)))
+
+    winners = df["winner_id"].tolist()
+    losers = df["loser_id"].tolist()
+    for i, (winner, loser, code) in enumerate(zip(winners, losers, codes.tolist())):
+        matches[0, i], wins[0, i] = history.counts(winner)
+        matches[1, i], wins[1, i] = history.counts(loser)
+        if code >= 0:
+            history.push(winner, code, 1)
+            history.push(loser, code, 0)
+
+    out = df.copy()
+    for side, name in enumerate(["winner", "loser"]):
+        archetypes = archetypes_from_counts(matches[side], wins[side]).astype(object)
+        archetypes[matches[side].sum(axis=1) < min_matches] = np.nan
+        out[f"{name}_archetype"] = archetypes
+    return out
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    print("Loading ATP matches...")
+    df = load_chronological_matches()
+
+    print("Streaming the matches through the ring buffers...")
+    out = rolling_archetypes(df)
+
+    print(f"Saving: {DATA_PATH}{OUT_CSV}")
+    columns = ["match_id", "tourney_id", "tourney_date", "match_num", "winner_id",
+               "winner_archetype", "loser_id", "loser_archetype"]
+    out[columns].to_csv(DATA_PATH + OUT_CSV, index=False)
+    print(f"Done in {time.perf_counter() - start:.1f}s.")
@@ -1,10 +1,22 @@
+import sys
 import pandas as pd
 import numpy as np
 from scipy.stats import chi2_contingency
 import matplotlib.pyplot as plt
+from pathlib import Path
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.permutation import permutation_test  # noqa: E402
+from archetype_pipeline import load_artefact  # noqa: E402
+from matchup_cube import RANK_BUCKETS  # noqa: E402
 
 DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
 PLOT_PATH = "../../graphs/archetype/"
+# The permutation test only shuffles archetypes between players of similar
+# rank(RANK_BUCKETS, the same as those of the matchup cube), so the archetypes
+# of strong players can't explain the result.
+N_PERM = 9999
 
 
 def test_sig(df):
@@ -13,7 +25,18 @@ def test_sig(df):
     return p
 
 
-def plot_win_rate_by_group(df, p_value):
+def test_sig_permutation(df):
+    # Same chi-square, but the p-value comes from shuffling the archetypes
+    # within rank buckets instead of the chi-square distribution, which
+    # assumes independent rows.
+    rank_bucket = pd.cut(df['player_rank'], RANK_BUCKETS).astype(str)
+    _, p = permutation_test(
+        df['won'], df['player_archetype'], "chi2", n_perm=N_PERM, strata=rank_bucket
+    )
+    return p
+
+
+def plot_win_rate_by_group(df, p_value, p_perm=None):
     win_rates = df.groupby('player_archetype')['won'].mean().sort_values()
 
     plt.figure(figsize=(8, 6))
@@ -47,9 +70,13 @@ def plot_win_rate_by_group(df, p_value):
     else:
         p_text = f"p = {p_value:.5f}"
 
+    text = f"Chi-square test: {p_text} ({significance})"
+    if p_perm is not None:
+        text += f"\nPermutation test within rank buckets: p = {p_perm:.4f}"
+
     plt.figtext(
         0.5, 0.02,
-        f"Chi-square test: {p_text} ({significance})",
+        text,
         ha='center',
         fontsize=11
     )
@@ -58,11 +85,14 @@ def plot_win_rate_by_group(df, p_value):
 
 
 if __name__ == "__main__":
-    data_file_path = DATA_PATH + "archetype_matchups.csv"
-    df = pd.read_csv(data_file_path)[['player_id', 'player_archetype', 'won']]
+    # The .pkl of the archetype pipeline if it is there, else the csv.
+    df = load_artefact("archetype_matchups", DATA_PATH)
+    df = df[['player_id', 'player_archetype', 'player_rank', 'won']]
 
     p_value = test_sig(df)
-    b_plot = plot_win_rate_by_group(df, p_value)
+    p_perm = test_sig_permutation(df)
+    print(f"Chi-square p = {p_value:.3e}, permutation p = {p_perm:.4f}")
+    b_plot = plot_win_rate_by_group(df, p_value, p_perm)
 
     print(f"Saving: {PLOT_PATH}archetype_winrates.png")
     b_plot.savefig(PLOT_PATH + "archetype_winrate.png", dpi=300)
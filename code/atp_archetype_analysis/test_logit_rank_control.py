@@ -1,19 +1,29 @@
+import sys
 import pandas as pd
 import numpy as np
-import statsmodels.formula.api as smf
 import matplotlib.pyplot as plt
-from scipy.stats import chi2
+from pathlib import Path
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.logit_cache import LogitCache  # noqa: E402
+from archetype_pipeline import load_artefact  # noqa: E402
 
 DATA_PATH = "../../data/tennis_atp_data/altered_data/archetype/"
 PLOT_PATH = "../../graphs/archetype/"
 
-df = pd.read_csv(DATA_PATH + "archetype_matchups.csv")
+# The .pkl of the archetype pipeline if it is there, else the csv.
+df = load_artefact("archetype_matchups", DATA_PATH)
 
 # Ensure rank is numeric
 df["player_rank"] = pd.to_numeric(df["player_rank"], errors="coerce")
 
+# All models below are fitted on df, the cache lets them start at the
+# coefficients of the models they contain and reuses them for the LR tests.
+cache = LogitCache(df)
+
 # Fit logistic regression
-model = smf.logit("won ~ player_archetype + player_rank", data=df).fit(disp=False)
+model = cache.fit("won ~ player_archetype + player_rank", disp=False)
 
 print(model.summary2().as_text())
 
@@ -33,10 +43,9 @@ pred_data["pred_prob"] = model.predict(pred_data)
 
 # Likelihood-ratio test to get overall p-value for the archetype block
 # H0: archetype has no effect after controlling for rank
-reduced = smf.logit("won ~ player_rank", data=df).fit(disp=False)
-lr_stat = 2 * (model.llf - reduced.llf)
-df_diff = int(model.df_model - reduced.df_model)
-p_arch = 1 - chi2.cdf(lr_stat, df_diff)
+lr_stat, df_diff, p_arch = cache.lr_test(
+    "won ~ player_archetype + player_rank", "won ~ player_rank", disp=False
+)
 
 # Plot and styling
 plt.figure(figsize=(8, 6))
@@ -104,22 +113,12 @@ plt.savefig(PLOT_PATH + "win_rate_vs_rank.png")
 # Make sure opponent_rank exists and is numeric (skip if already numeric)
 df["opponent_rank"] = pd.to_numeric(df["opponent_rank"], errors="coerce")
 
-# Full model: player archetype + opponent archetype
-matchup_model = smf.logit(
-    "won ~ player_archetype + opponent_archetype",
-    data=df
-).fit(disp=False)
-
-# Reduced model: player archetype only
-reduced_matchup = smf.logit(
-    "won ~ player_archetype",
-    data=df
-).fit(disp=False)
-
-# Likelihood-ratio test
-lr_stat = 2 * (matchup_model.llf - reduced_matchup.llf)
-df_diff = matchup_model.df_model - reduced_matchup.df_model
-p_matchup = 1 - chi2.cdf(lr_stat, df_diff)
+# Likelihood-ratio test of the full model (player archetype + opponent
+# archetype) against the reduced model (player archetype only).
+lr_stat, df_diff, p_matchup = cache.lr_test(
+    "won ~ player_archetype + opponent_archetype", "won ~ player_archetype", disp=False
+)
+matchup_model = cache.fit("won ~ player_archetype + opponent_archetype", disp=False)
 
 # Define the order for rows/cols
 archetype_order = ["Sprinter", "Balanced", "Endurance"]
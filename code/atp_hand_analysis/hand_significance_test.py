@@ -1,7 +1,13 @@
+import sys
 import pandas as pd
 import numpy as np
 from statsmodels.stats.proportion import proportions_ztest
 import matplotlib.pyplot as plt
+from pathlib import Path
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.permutation import permutation_test  # noqa: E402
 
 DATA = "../../data/tennis_atp_data/altered_data/hand/hand_winrate_summary.csv"
 
@@ -26,7 +32,25 @@ def two_proportion_z_test(wins_R, total_R, wins_L, total_L):
     return z_stat, p_value
 
 
-def plot_winrate_barchart(summary, p_value=None, z_value=None):
+def permutation_z_test(wins_R, total_R, wins_L, total_L, n_perm=9999):
+    """
+    Same z statistic, but the p-value comes from shuffling the hands between
+    match appearances instead of the normal approximation.
+
+    Returns:
+        p_value (float): two-tailed permutation p-value
+    """
+    # Every appearance as won(1)/lost(0) with its hand, rebuilt from the counts.
+    won = np.r_[
+        np.ones(wins_R), np.zeros(total_R - wins_R),
+        np.ones(wins_L), np.zeros(total_L - wins_L),
+    ]
+    hand = np.r_[np.repeat("R", total_R), np.repeat("L", total_L)]
+    _, p_value = permutation_test(won, hand, "z", n_perm=n_perm)
+    return p_value
+
+
+def plot_winrate_barchart(summary, p_value=None, z_value=None, p_perm=None):
     """
     Win rate bar chart
     """
@@ -88,11 +112,17 @@ def plot_winrate_barchart(summary, p_value=None, z_value=None):
         ci_low_pp = (diff - 1.96 * se_diff) * 100
         ci_high_pp = (diff + 1.96 * se_diff) * 100
 
-        plt.figtext(
-            0.5, 0.08,
+        text = (
             f"Two-proportion z-test: z = {z_value:.2f}, {p_text} ({significance})\n"
             f"Difference (Right − Left) = {diff_pp:.2f} percentage points\n"
-            f"95% CI for difference: [{ci_low_pp:.2f}, {ci_high_pp:.2f}] percentage points",
+            f"95% CI for difference: [{ci_low_pp:.2f}, {ci_high_pp:.2f}] percentage points"
+        )
+        if p_perm is not None:
+            text += f"\nPermutation test: p = {p_perm:.4f}"
+
+        plt.figtext(
+            0.5, 0.08,
+            text,
             ha="center",
             fontsize=11
         )
@@ -162,8 +192,15 @@ def main():
         total_L=winrate_summary.loc["L", "Total Matches"]
     )
 
+    p_perm = permutation_z_test(
+        wins_R=winrate_summary.loc["R", "Wins"],
+        wins_L=winrate_summary.loc["L", "Wins"],
+        total_R=winrate_summary.loc["R", "Total Matches"],
+        total_L=winrate_summary.loc["L", "Total Matches"]
+    )
+
     # Result plot
-    plot_winrate_barchart(winrate_summary, p_value=p, z_value=z)
+    plot_winrate_barchart(winrate_summary, p_value=p, z_value=z, p_perm=p_perm)
     plt.savefig("../../graphs/hand/winrate_barchart.png", dpi=300, bbox_inches="tight")
     plt.close()
 
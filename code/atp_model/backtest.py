@@ -0,0 +1,187 @@
+"""
+This file contains the walk-forward backtest of the prediction models. Instead
+of the single train/test split of test_model.py, every season from
+FIRST_SEASON onwards is predicted by a model trained on all seasons before it.
+
+Refitting from zero for every season would cost N full fits. Instead every
+refit starts at the coefficients of the previous season, and its first Newton
+step only needs the new season's rows, the Hessian of the older rows is kept
+from the previous fit.
+"""
+
+import sys
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+from pathlib import Path
+from patsy import dmatrices
+from scipy.special import expit
+
+from test_model import get_formulas
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.logit import TOL, fit_logit, newton_step, score_and_hessian  # noqa: E402
+from shared.metrics import evaluate  # noqa: E402
+
+OUTPUT_DIR = "../../data/tennis_atp_data/altered_data/atp_model"
+OUT_FN = f"{OUTPUT_DIR}/backtest_results.csv"
+PNG_DIR = "../../graphs/atp_model"
+
+# The formulas of get_formulas() to backtest, 0, 1 and 3 are the ones used in
+# the presentation.
+FORMULA_NO = [0, 1, 3]
+FIRST_SEASON = 2000
+
+
+def init_out_dir():
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+    Path(PNG_DIR).mkdir(parents=True, exist_ok=True)
+
+
+def walk_forward(df, formula, first_season=FIRST_SEASON, last_season=None,
+                 date_col="tourney_date", exact=True):
+    """
+    Trains on every season before s and tests on season s, for every season s
+    from first_season up to and including last_season.
+
+    The design matrix is built once on the whole history, so spline knots are
+    placed using the covariates of later seasons as well. Only the covariates
+    are used for that, never the results.
+
+    exact - bool
+        If False only the cached Newton step is taken per season, which is
+        cheaper but drifts slightly from the exact fit over many seasons.
+
+    Returns a list of dicts, one per season.
+    """
+    df = df.sort_values(date_col, kind="mergesort")
+    y, X = dmatrices(formula, df, return_type="dataframe")
+    season = df.loc[X.index, date_col].dt.year.to_numpy()
+    X = X.to_numpy()
+    y = y.to_numpy().ravel()
+
+    if last_season is None:
+        last_season = int(season.max())
+
+    beta = None
+    hessian = None
+    n_prev = 0
+    rows = []
+    for s in range(first_season, last_season + 1):
+        # The data is sorted, so the training set is always a prefix.
+        n_train = int(np.searchsorted(season, s, side="left"))
+        n_test = int(np.searchsorted(season, s, side="right")) - n_train
+        if n_test == 0 or n_train == 0:
+            continue
+
+        if beta is None:
+            fit = fit_logit(X[:n_train], y[:n_train])
+            beta, hessian, n_iter = fit.params, fit.hessian, fit.n_iter
+        else:
+            # At the previous optimum the gradient of the old rows is zero, so
+            # only the new rows contribute to it. Their Hessian gets added to
+            # the cached one of the old rows.
+            gradient, new_hessian = score_and_hessian(
+                X[n_prev:n_train], y[n_prev:n_train], beta
+            )
+            hessian = hessian + new_hessian
+            step = newton_step(gradient, hessian)
+            beta = beta + step
+            n_iter = 1
+            if exact and np.max(np.abs(step)) >= TOL:
+                fit = fit_logit(X[:n_train], y[:n_train], start_params=beta)
+                beta, hessian = fit.params, fit.hessian
+                n_iter += fit.n_iter
+        n_prev = n_train
+
+        X_test = X[n_train:n_train + n_test]
+        y_test = y[n_train:n_train + n_test].astype(int)
+        scores = evaluate(y_test, expit(X_test @ beta))
+
+        rows.append(
+            {
+                "season": s,
+                "n_train": n_train,
+                "n_test": n_test,
+                "n_iter": n_iter,
+                "accuracy_score": round(scores["accuracy_score"] * 100, 2),
+                "log_loss": scores["log_loss"],
+                "brier_score_loss": scores["brier_score_loss"],
+                "roc_auc_score": scores["roc_auc_score"],
+            }
+        )
+    return rows
+
+
+def plot_backtest(results_df):
+    fig, (ax_acc, ax_ll) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+
+    for formula_no, group in results_df.groupby("formula_no"):
+        ax_acc.plot(group["season"], group["accuracy_score"], label=f"Formula {formula_no}")
+        ax_ll.plot(group["season"], group["log_loss"], label=f"Formula {formula_no}")
+
+    ax_acc.set_ylabel("Accuracy (%)")
+    ax_ll.set_ylabel("Log loss")
+    ax_ll.set_xlabel("Season")
+    ax_acc.set_title("Walk-forward backtest, each season predicted by all seasons before it")
+    for ax in (ax_acc, ax_ll):
+        ax.grid(True)
+        ax.legend()
+
+    fig.savefig(f"{PNG_DIR}/backtest.png", bbox_inches="tight")
+    plt.close(fig)
+
+
+def main():
+    print("Starting the walk-forward backtest of the various models…")
+    path = Path(f"{OUTPUT_DIR}/filtered_data.csv")
+    if not path.is_file():
+        print("\tfiltered_data.csv Is missing, please run clean_data.py first.")
+        return 1
+    init_out_dir()
+    df = pd.read_csv(path)
+    # Won't touch categories.
+    df.dropna(inplace=True)
+    df["tourney_date"] = pd.to_datetime(
+        df["tourney_date"], format="%Y-%m-%d", errors="coerce"
+    )
+    df.dropna(subset=["tourney_date"], inplace=True)
+
+    formulas = get_formulas()
+    results = []
+    for i in FORMULA_NO:
+        print(f"\tBacktesting formula #{i}…")
+        for row in walk_forward(df, formulas[i]):
+            row["formula_no"] = i
+            print(
+                f"\t\t{row['season']}: accuracy {row['accuracy_score']}, "
+                f"logloss {row['log_loss']:.4f}, {row['n_iter']} Newton iterations"
+            )
+            results.append(row)
+
+    results_df = pd.DataFrame(results)
+    results_df = results_df[
+        [
+            "formula_no",
+            "season",
+            "n_train",
+            "n_test",
+            "n_iter",
+            "accuracy_score",
+            "log_loss",
+            "brier_score_loss",
+            "roc_auc_score",
+        ]
+    ]
+    print(f"\tWriting the result to {OUT_FN}")
+    results_df.to_csv(OUT_FN, index=False)
+    plot_backtest(results_df)
+    print(f"\tSaved the plot to {PNG_DIR}/backtest.png")
+
+    print("Done with the walk-forward backtest!\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
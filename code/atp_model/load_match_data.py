@@ -2,39 +2,51 @@ import pandas as pd
 import glob
 import re
 import os
+import sys
 import numpy as np
+from pathlib import Path
 
 from collections import defaultdict
 
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.match_keys import match_keys  # noqa: E402
+from shared.players import PlayerIndex  # noqa: E402
+
+# The archetype of players with too few earlier matches for one, with
+# ROLLING_ARCHETYPES. It sorts after the real archetypes, so "Balanced" stays
+# the reference level of C(p1_archetype).
+UNKNOWN_ARCHETYPE = "Unknown"
+
 
 # 1) Load raw ATP matches & keep only needed columns
 def load_clean_matches(
     path_pattern="../../data/tennis_atp_data/unaltered_data/*",
     regex=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$",
+    players_csv="../../data/tennis_atp_data/unaltered_data/atp_players.csv",
+    players=None,
 ):
     """
     Loads ATP matches for 1991–2024 (based on filename), and returns a dataframe
     with the columns required to build player-pair rows. This function DOES NOT
     expand into p1/p2 yet — see `build_player_pairs` below.
+    The hand, height and age of the players are looked up in players, a
+    PlayerIndex, which is loaded from players_csv if it is not given.
     """
     pattern = re.compile(regex)
     files = glob.glob(path_pattern)
     dfs = []
 
+    # Only the ids are read, the hand, height and age of the players come from
+    # the player table of atp_players.csv.
     usecols = [
         "tourney_id",
         "tourney_date",
         "match_num",
         "surface",
         "winner_id",
-        "winner_hand",
-        "winner_ht",
-        "winner_age",
         "winner_rank_points",
         "loser_id",
-        "loser_hand",
-        "loser_ht",
-        "loser_age",
         "loser_rank_points",
     ]
 
@@ -52,35 +64,44 @@ def load_clean_matches(
 
         # Coerce numeric fields
         for col in [
-            "winner_ht",
-            "winner_age",
             "winner_rank_points",
-            "loser_ht",
-            "loser_age",
             "loser_rank_points",
             "tourney_date",
         ]:
             df[col] = pd.to_numeric(df[col], errors="coerce")
 
-        # Normalize handedness
-        def _norm_hand(x):
-            if pd.isna(x):
-                return pd.NA
-            x = str(x).strip().upper()
-            if x in {"R", "L", "U"}:
-                return x
-            return x  # keep anything else as-is (e.g., 'A')
-
-        df["winner_hand"] = df["winner_hand"].map(_norm_hand)
-        df["loser_hand"] = df["loser_hand"].map(_norm_hand)
-
         df = df[usecols]
         dfs.append(df)
 
+    columns = [
+        "tourney_id",
+        "tourney_date",
+        "match_num",
+        "surface",
+        "winner_id",
+        "winner_hand",
+        "winner_ht",
+        "winner_age",
+        "winner_rank_points",
+        "loser_id",
+        "loser_hand",
+        "loser_ht",
+        "loser_age",
+        "loser_rank_points",
+    ]
     if not dfs:
-        return pd.DataFrame(columns=usecols)
+        return pd.DataFrame(columns=columns)
 
-    return pd.concat(dfs, ignore_index=True)
+    df = pd.concat(dfs, ignore_index=True)
+    if players is None:
+        players = PlayerIndex.from_csv(players_csv)
+    # The hand is normalized once per player instead of once per match, and
+    # the age is computed exactly from the date of birth.
+    for side in ["winner", "loser"]:
+        attrs = players.attributes(df[f"{side}_id"], df["tourney_date"], side)
+        for attr in ["hand", "ht", "age"]:
+            df[f"{side}_{attr}"] = attrs[f"{side}_{attr}"].to_numpy()
+    return df[columns]
 
 
 # 2) Build player-pair rows
@@ -237,6 +258,38 @@ def add_player_archetypes(
     return out
 
 
+# 4b) Merge the as-of archetypes of rolling_archetypes.py into the matches dataset
+def add_rolling_player_archetypes(
+    matches_df: pd.DataFrame, csv_path: str
+) -> pd.DataFrame:
+    """
+    Adds 'p1_archetype' and 'p2_archetype' columns to matches_df, the
+    archetypes of the players right before the match instead of the single
+    archetype per player of add_player_archetypes(), which is based on their
+    last matches in the entire data set. A match is found through its
+    match_id, which is computed from the tourney_id and match_num, the winner
+    and loser archetype are mapped onto p1 and p2 using result.
+
+    Players with too few earlier matches for an archetype get UNKNOWN_ARCHETYPE
+    instead of NaN, otherwise the dropna() of test_model.py would drop about 40%
+    of the rows, most of them matches of young players.
+    """
+    arch = pd.read_csv(
+        csv_path,
+        usecols=["match_id", "winner_archetype", "loser_archetype"],
+    )
+    out = matches_df.copy()
+    out["match_id"] = match_keys(out["tourney_id"], out["match_num"], "atp", "main")
+    out = out.merge(arch, on="match_id", how="left")
+    won = out["result"] == 1
+    out["p1_archetype"] = out["winner_archetype"].where(won, out["loser_archetype"])
+    out["p2_archetype"] = out["loser_archetype"].where(won, out["winner_archetype"])
+    out[["p1_archetype", "p2_archetype"]] = out[["p1_archetype", "p2_archetype"]].fillna(
+        UNKNOWN_ARCHETYPE
+    )
+    return out.drop(columns=["match_id", "winner_archetype", "loser_archetype"])
+
+
 # 5) Add surface winrates
 def add_surface_winrates(data):
     """
@@ -352,21 +405,23 @@ def add_win_streak(data):
 
 
 # 8) Add p1_favor
+# The bins of rel_ranking_points, right edges included like pd.cut.
+FAVOR_BINS = [-np.inf, -0.5, -0.2, -0.05, 0.05, 0.2, 0.5, np.inf]
+FAVOR_LABELS = [
+    "heavy_underdog",
+    "moderate_underdog",
+    "slight_underdog",
+    "even",
+    "slight_favorite",
+    "moderate_favorite",
+    "heavy_favorite",
+]
+
+
 def add_favor(data):
     df = data
 
-    bins = [-np.inf, -0.5, -0.2, -0.05, 0.05, 0.2, 0.5, np.inf]
-    labels = [
-        "heavy_underdog",
-        "moderate_underdog",
-        "slight_underdog",
-        "even",
-        "slight_favorite",
-        "moderate_favorite",
-        "heavy_favorite",
-    ]
-
-    df["p1_favor"] = pd.cut(df["rel_ranking_points"], bins=bins, labels=labels)
+    df["p1_favor"] = pd.cut(df["rel_ranking_points"], bins=FAVOR_BINS, labels=FAVOR_LABELS)
 
     return df
 
@@ -407,6 +462,13 @@ if __name__ == "__main__":
     ARCHETYPES_CSV = (
         "../../data/tennis_atp_data/altered_data/archetype/matches_with_archetypes.csv"
     )
+    ROLLING_ARCHETYPES_CSV = (
+        "../../data/tennis_atp_data/altered_data/archetype/rolling_archetypes.csv"
+    )
+    # With True every match gets the archetypes of its players as of that
+    # match(rolling_archetypes.py), instead of one archetype per player that is
+    # based on their last matches, which are usually in the future.
+    ROLLING_ARCHETYPES = True
     OUTPUT_CSV = "../../data/tennis_atp_data/altered_data/atp_model/atp_player_pairs_1991_2024.csv"
 
     # Build base dataset
@@ -414,8 +476,11 @@ if __name__ == "__main__":
     dataset = build_player_pairs(matches, expand_symmetry=True)
 
     # Build player_id to archetype lookup & merge
-    archetypes_df = make_archetype_lookup_from_matches(ARCHETYPES_CSV)
-    dataset_with_arch = add_player_archetypes(dataset, archetypes_df)
+    if ROLLING_ARCHETYPES:
+        dataset_with_arch = add_rolling_player_archetypes(dataset, ROLLING_ARCHETYPES_CSV)
+    else:
+        archetypes_df = make_archetype_lookup_from_matches(ARCHETYPES_CSV)
+        dataset_with_arch = add_player_archetypes(dataset, archetypes_df)
 
     # Add surface winrates
     dataset_with_surface = add_surface_winrates(dataset_with_arch)
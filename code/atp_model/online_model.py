@@ -0,0 +1,253 @@
+"""
+This file contains an online version of the prediction model. Instead of
+refitting on the full history with test_model.py, it is a logistic regression
+trained with stochastic gradient descent that is updated after every match, so
+its win probabilities always include the most recent results.
+
+It uses the same features as formula 5 (or formula 6 with
+ranking_col="abs_ranking_points") of test_model.py. Those are built by hand
+instead of with patsy, since patsy is far too slow for a single row and its
+objects can not be pickled.
+"""
+
+import sys
+import pickle
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from scipy.interpolate import BSpline
+from scipy.special import expit
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.metrics import evaluate  # noqa: E402
+from shared.match_keys import match_keys  # noqa: E402
+
+OUTPUT_DIR = "../../data/tennis_atp_data/altered_data/atp_model"
+MODEL_FN = f"{OUTPUT_DIR}/online_model.pkl"
+PRED_FN = f"{OUTPUT_DIR}/online_predictions.csv"
+
+CATEGORICAL = [
+    "surface",
+    "p1_handedness",
+    "p2_handedness",
+    "p1_archetype",
+    "p2_archetype",
+    "p1_favor",
+]
+SPLINES = ["p1_age", "p2_age", "p1_ht", "p2_ht"]
+# Same as bs(x, df=6) in the formulas.
+SPLINE_DF = 6
+SPLINE_DEGREE = 3
+
+# The feature layout is learned from the seasons before this one, every season
+# from it onwards is predicted out of sample.
+FIRST_SEASON = 2000
+TEST_YEARS = {2022, 2023, 2024}
+
+
+def init_out_dir():
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+
+
+class OnlineLogit:
+    def __init__(self, ranking_col="rel_ranking_points", l2=1e-5, learning_rate="invscaling",
+                 eta0=0.05, power_t=0.25):
+        """
+        ranking_col - str
+            rel_ranking_points for formula 5, abs_ranking_points for formula 6.
+        l2 - float
+            Strength of the L2 penalty, the intercept is not penalised.
+        learning_rate - str
+            "constant" uses eta0 for every update, "invscaling" uses
+            eta0 / t^power_t for update t, like sklearn's SGDClassifier.
+        """
+        if learning_rate not in {"constant", "invscaling"}:
+            raise ValueError(f"Unknown learning_rate: {learning_rate}")
+        self.ranking_col = ranking_col
+        self.l2 = l2
+        self.learning_rate = learning_rate
+        self.eta0 = eta0
+        self.power_t = power_t
+        # Amount of updates so far.
+        self.t = 0
+        self.levels = None
+        self.knots = None
+        self.mean = None
+        self.std = None
+        self.coef = None
+
+    def fit_features(self, df):
+        """
+        Learns the category levels, spline knots and scaling from df, this
+        fixes the feature layout. Only the covariates are used, not the
+        results, so df may overlap with the matches that are predicted later.
+        """
+        self.levels = {}
+        for col in CATEGORICAL:
+            # The first level is the reference, like patsy's C().
+            self.levels[col] = sorted(df[col].dropna().astype(str).unique())[1:]
+
+        self.knots = {}
+        n_inner = SPLINE_DF - SPLINE_DEGREE
+        for col in SPLINES:
+            x = df[col].to_numpy(dtype=float)
+            inner = np.quantile(x, np.linspace(0, 1, n_inner + 2)[1:-1])
+            self.knots[col] = np.r_[
+                [x.min()] * (SPLINE_DEGREE + 1), inner, [x.max()] * (SPLINE_DEGREE + 1)
+            ]
+
+        # Scaling only matters for SGD, the unscaled numeric columns differ
+        # a lot in size which makes a single learning rate a bad fit.
+        numeric = self._numeric(df)
+        self.mean = numeric.mean(axis=0)
+        self.std = numeric.std(axis=0)
+        self.std[self.std == 0] = 1
+
+        self.coef = np.zeros(self.featurize(df.iloc[:1]).shape[1])
+        self.t = 0
+        return self
+
+    def _numeric(self, df):
+        return np.column_stack(
+            [
+                df["p1_streak"].to_numpy(dtype=float),
+                df[self.ranking_col].to_numpy(dtype=float),
+                (df["p1_surface_winrate"] - df["p2_surface_winrate"]).to_numpy(dtype=float),
+                (df["p1_streak"] - df["p2_streak"]).to_numpy(dtype=float),
+            ]
+        )
+
+    def featurize(self, df):
+        """
+        Returns the design matrix of df, one row per row of df. The first
+        column is the intercept.
+        """
+        n = len(df)
+        blocks = [np.ones((n, 1))]
+
+        dummies = {}
+        for col in CATEGORICAL:
+            values = df[col].astype(str).to_numpy()
+            dummies[col] = np.column_stack(
+                [values == level for level in self.levels[col]] or [np.zeros(n)]
+            ).astype(float)
+            blocks.append(dummies[col])
+
+        for col in SPLINES:
+            t = self.knots[col]
+            # Outside the knots the spline is not defined, so clip to the
+            # range seen in fit_features().
+            x = np.clip(df[col].to_numpy(dtype=float), t[0], t[-1])
+            basis = BSpline.design_matrix(x, t, SPLINE_DEGREE).toarray()
+            # The first basis function is dropped, like bs() does.
+            blocks.append(basis[:, 1:])
+
+        numeric = (self._numeric(df) - self.mean) / self.std
+        blocks.append(numeric)
+        # C(p1_favor) * p1_streak, the interaction part.
+        blocks.append(dummies["p1_favor"] * numeric[:, [0]])
+
+        return np.hstack(blocks)
+
+    def _eta(self):
+        if self.learning_rate == "constant":
+            return self.eta0
+        return self.eta0 / (self.t + 1) ** self.power_t
+
+    def predict_proba(self, X):
+        return expit(X @ self.coef)
+
+    def partial_fit(self, x, y):
+        """
+        A single SGD update on one design row x with result y.
+        """
+        p = expit(x @ self.coef)
+        grad = (p - y) * x
+        grad[1:] += self.l2 * self.coef[1:]
+        self.coef -= self._eta() * grad
+        self.t += 1
+        return p
+
+    def replay(self, X, y, match_key):
+        """
+        Goes through the rows in order, predicting every match before the
+        model is updated with it. Both rows of a match (winner as p1 and loser
+        as p1) share a match_key and are predicted before either is learned
+        from, so every returned probability is out of sample.
+        """
+        p = np.empty(len(y))
+        start = 0
+        n = len(y)
+        while start < n:
+            end = start + 1
+            while end < n and match_key[end] == match_key[start]:
+                end += 1
+            p[start:end] = self.predict_proba(X[start:end])
+            for i in range(start, end):
+                self.partial_fit(X[i], y[i])
+            start = end
+        return p
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def main():
+    print("Starting the online model replay…")
+    path = Path(f"{OUTPUT_DIR}/filtered_data.csv")
+    if not path.is_file():
+        print("\tfiltered_data.csv Is missing, please run clean_data.py first.")
+        return 1
+    init_out_dir()
+    df = pd.read_csv(path)
+    # Won't touch categories.
+    df.dropna(inplace=True)
+    df["tourney_date"] = pd.to_datetime(
+        df["tourney_date"], format="%Y-%m-%d", errors="coerce"
+    )
+    df.dropna(subset=["tourney_date"], inplace=True)
+    # The same order as add_win_streak() in load_match_data.py.
+    df = df.sort_values(["tourney_date", "tourney_id", "match_num"], kind="mergesort")
+    df = df.reset_index(drop=True)
+    year = df["tourney_date"].dt.year
+
+    model = OnlineLogit()
+    model.fit_features(df[year < FIRST_SEASON])
+
+    X = model.featurize(df)
+    y = df["result"].to_numpy(dtype=float)
+    match_key = match_keys(df["tourney_id"], df["match_num"], "atp", "main")
+    print(f"\tReplaying {len(df)} rows…")
+    p = model.replay(X, y, match_key)
+
+    df["p_online"] = p
+    for name, mask in [
+        (f"{FIRST_SEASON}-", year >= FIRST_SEASON),
+        ("test years", year.isin(TEST_YEARS)),
+    ]:
+        scores = evaluate(y[mask], p[mask])
+        print(f"\t{name}:")
+        print(f"\t\taccuracy: {round(scores['accuracy_score'] * 100, 2)}")
+        print(f"\t\tlogloss: {scores['log_loss']}")
+        print(f"\t\tbrier: {scores['brier_score_loss']}")
+        print(f"\t\tauc: {scores['roc_auc_score']}")
+
+    print(f"\tWriting the predictions to {PRED_FN}")
+    df.loc[year >= FIRST_SEASON, ["tourney_date", "tourney_id", "match_num", "p1_id",
+                                  "p2_id", "result", "p_online"]].to_csv(PRED_FN, index=False)
+    print(f"\tSaving the model to {MODEL_FN}")
+    model.save(MODEL_FN)
+
+    print("Done with the online model replay!\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
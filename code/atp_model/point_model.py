@@ -0,0 +1,349 @@
+"""
+This file contains a point based model of a tennis match. Every player has a
+probability of winning a point on their own serve, and from those two numbers
+the probability of winning a game, tiebreak, set and best of 3 or 5 match
+follows exactly, assuming the points are independent:
+
+- game: closed form, the chance to reach 4 points first plus the chance to win
+  from deuce.
+- tiebreak: dynamic programming over the scores up to 6-6, with the serve
+  switching every two points, and a closed form from 6-6 on.
+- set: dynamic programming over the games with alternating serve and a
+  tiebreak at 6-6. It also keeps track of who serves first in the next set.
+- match: dynamic programming over the sets, averaged over who serves first.
+
+All of those are vectorized over arrays of serve probabilities. The match
+probabilities are computed once for a GRID x GRID table of serve
+probabilities, after which match_probability() of any pair is a bilinear
+interpolation in that table.
+
+The serve probabilities of a matchup come from the serve stats of the match
+files (w_svpt, w_1stWon, w_2ndWon and the same for l_), combined like Barnett
+and Clarke: the serve of A against B is the tour average, plus how much better
+A serves than average, minus how much better B returns than average.
+
+sample_matches() simulates many matches at once, game by game with the exact
+game and tiebreak probabilities, giving the final score as well.
+"""
+
+import glob
+import os
+import re
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.metrics import evaluate  # noqa: E402
+
+# Points in the table per axis, from 0 to 1.
+GRID = 201
+# Serve points of the tour average added to every player, so players with
+# few matches are pulled towards the average.
+PRIOR_POINTS = 300
+TRAIN_YEARS = range(1991, 2022)
+TEST_YEARS = {2022, 2023, 2024}
+SERVE_COLS = ["svpt", "1stWon", "2ndWon"]
+
+
+def game_probability(p):
+    """
+    The probability that the server wins a game, with a probability p of
+    winning every point.
+    """
+    p = np.asarray(p, dtype=float)
+    q = 1 - p
+    # 4-0, 4-1 and 4-2, then reaching 3-3 and winning from deuce.
+    before_deuce = p ** 4 * (1 + 4 * q + 10 * q ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        deuce = 20 * p ** 3 * q ** 3 * p ** 2 / (1 - 2 * p * q)
+    return before_deuce + np.nan_to_num(deuce)
+
+
+def _from_even(x, y):
+    """
+    The probability of winning a race that needs a lead of 2, per 2 points
+    winning both with x and losing both with y.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(x + y > 0, x / (x + y), 0.5)
+
+
+def tiebreak_probability(pa, pb):
+    """
+    The probability that A wins a tiebreak in which A serves first, pa and pb
+    being the probabilities that A and B win a point on their own serve.
+    """
+    pa, pb = np.broadcast_arrays(np.asarray(pa, dtype=float), np.asarray(pb, dtype=float))
+    # score[i, j], the probability of reaching i-j.
+    score = {(0, 0): np.ones(pa.shape)}
+    win = np.zeros(pa.shape)
+    for total in range(12):
+        # A serves the first point, after that every player serves two.
+        a_point = pa if (total + 1) // 2 % 2 == 0 else 1 - pb
+        for i in range(max(0, total - 6), min(total, 6) + 1):
+            j = total - i
+            p = score.pop((i, j), None)
+            if p is None:
+                continue
+            if i == 6:
+                win += p * a_point
+            else:
+                score[(i + 1, j)] = score.get((i + 1, j), 0) + p * a_point
+            if j < 6:
+                score[(i, j + 1)] = score.get((i, j + 1), 0) + p * (1 - a_point)
+    # From 6-6 on both players serve one of every two points.
+    return win + score[(6, 6)] * _from_even(pa * (1 - pb), (1 - pa) * pb)
+
+
+def set_outcomes(pa, pb):
+    """
+    The result of a set in which A serves first. Returns the probabilities
+    that A wins and serves first in the next set, A wins and B serves next,
+    B wins and A serves next and B wins and B serves next.
+    """
+    pa, pb = np.broadcast_arrays(np.asarray(pa, dtype=float), np.asarray(pb, dtype=float))
+    hold_a = game_probability(pa)
+    break_b = 1 - game_probability(pb)
+    games = {(0, 0): np.ones(pa.shape)}
+    # [A wins, B wins] x [A serves next, B serves next]
+    out = np.zeros((2, 2) + pa.shape)
+    for total in range(12):
+        a_game = hold_a if total % 2 == 0 else break_b
+        for i in range(total + 1):
+            j = total - i
+            p = games.pop((i, j), None)
+            if p is None:
+                continue
+            for winner, q, new in [(0, a_game, (i + 1, j)), (1, 1 - a_game, (i, j + 1))]:
+                a, b = new
+                # The player that received in the last game serves next.
+                next_server = 0 if (total + 1) % 2 == 0 else 1
+                if max(a, b) == 6 and abs(a - b) >= 2 or max(a, b) == 7:
+                    out[winner, next_server] += p * q
+                else:
+                    games[new] = games.get(new, 0) + p * q
+    # 6-6, A serves first in the tiebreak, so B serves first in the next set.
+    tiebreak = tiebreak_probability(pa, pb)
+    out[0, 1] += games[(6, 6)] * tiebreak
+    out[1, 1] += games[(6, 6)] * (1 - tiebreak)
+    return out
+
+
+def match_probability_exact(pa, pb, best_of=3):
+    """
+    The probability that A wins a best of best_of match, with a coin toss
+    for who serves first.
+    """
+    pa, pb = np.broadcast_arrays(np.asarray(pa, dtype=float), np.asarray(pb, dtype=float))
+    # The sets of B serving first, seen from B, with A and B swapped back.
+    a_first = set_outcomes(pa, pb)
+    b_first = set_outcomes(pb, pa)[::-1, ::-1]
+    need = (best_of + 1) // 2
+    # (A sets, B sets, A serves next) -> probability
+    states = {(0, 0, 0): np.full(pa.shape, 0.5), (0, 0, 1): np.full(pa.shape, 0.5)}
+    win = np.zeros(pa.shape)
+    for _ in range(best_of):
+        new_states = {}
+        for (a, b, server), p in states.items():
+            outcomes = a_first if server == 0 else b_first
+            for winner in [0, 1]:
+                for next_server in [0, 1]:
+                    q = p * outcomes[winner, next_server]
+                    na, nb = (a + 1, b) if winner == 0 else (a, b + 1)
+                    if na == need:
+                        win += q
+                    elif nb < need:
+                        key = (na, nb, next_server)
+                        new_states[key] = new_states.get(key, 0) + q
+        states = new_states
+    return win
+
+
+@lru_cache(maxsize=None)
+def match_table(best_of=3, grid=GRID):
+    """
+    match_probability_exact() for every pair of a grid x grid table of serve
+    probabilities, computed once per best_of.
+    """
+    x = np.linspace(0, 1, grid)
+    pa, pb = np.meshgrid(x, x, indexing="ij")
+    return match_probability_exact(pa, pb, best_of)
+
+
+def match_probability(pa, pb, best_of=3):
+    """
+    The probability that A wins, with pa and pb the probabilities of A and B
+    winning a point on their own serve. A bilinear interpolation in
+    match_table(), so it takes the same time for any pa and pb. NaN where pa
+    or pb is NaN or infinite, e.g. for players without serve statistics.
+    """
+    table = match_table(best_of)
+    n = len(table) - 1
+    pa, pb = np.broadcast_arrays(np.asarray(pa, dtype=float), np.asarray(pb, dtype=float))
+    # Missing probabilities would otherwise become a table index far outside
+    # of it, so they are looked up as 0 and set to NaN afterwards.
+    ok = np.isfinite(pa) & np.isfinite(pb)
+    x = np.clip(np.where(ok, pa, 0), 0, 1) * n
+    y = np.clip(np.where(ok, pb, 0), 0, 1) * n
+    i = np.minimum(x.astype(int), n - 1)
+    j = np.minimum(y.astype(int), n - 1)
+    dx = x - i
+    dy = y - j
+    p = ((1 - dx) * (1 - dy) * table[i, j] + dx * (1 - dy) * table[i + 1, j]
+         + (1 - dx) * dy * table[i, j + 1] + dx * dy * table[i + 1, j + 1])
+    return np.where(ok, p, np.nan)[()]
+
+
+def sample_matches(pa, pb, best_of=3, rng=None):
+    """
+    Simulates a match for every pair of pa and pb at once, game by game with
+    the exact game and tiebreak probabilities. The first server is a coin
+    toss.
+
+    Returns a DataFrame with a_won and the sets and games won by A and B.
+    """
+    rng = np.random.default_rng(rng)
+    pa, pb = np.broadcast_arrays(np.atleast_1d(np.asarray(pa, dtype=float)),
+                                 np.atleast_1d(np.asarray(pb, dtype=float)))
+    n = len(pa)
+    hold = np.stack([game_probability(pa), game_probability(pb)])
+    tiebreak = np.stack([tiebreak_probability(pa, pb), 1 - tiebreak_probability(pb, pa)])
+    need = (best_of + 1) // 2
+    rows = np.arange(n)
+    # 0 if A serves, 1 if B serves.
+    server = rng.integers(0, 2, n)
+    sets = np.zeros((2, n), dtype=int)
+    games = np.zeros((2, n), dtype=int)
+    playing = np.ones(n, dtype=bool)
+    while playing.any():
+        set_games = np.zeros((2, n), dtype=int)
+        in_set = playing.copy()
+        while in_set.any():
+            at_tiebreak = in_set & (set_games[0] == 6) & (set_games[1] == 6)
+            # The probability that A wins this game.
+            p_a = np.where(server == 0, hold[0, rows], 1 - hold[1, rows])
+            p_a = np.where(at_tiebreak, tiebreak[server, rows], p_a)
+            a_won = rng.random(n) < p_a
+            set_games[0] += in_set & a_won
+            set_games[1] += in_set & ~a_won
+            server = np.where(in_set, 1 - server, server)
+            high = set_games.max(axis=0)
+            lead = np.abs(set_games[0] - set_games[1])
+            done = in_set & ((high == 7) | ((high == 6) & (lead >= 2)))
+            sets[0] += done & (set_games[0] > set_games[1])
+            sets[1] += done & (set_games[1] > set_games[0])
+            in_set &= ~done
+        games += set_games * playing
+        playing &= sets.max(axis=0) < need
+    return pd.DataFrame({"a_won": sets[0] == need, "a_sets": sets[0], "b_sets": sets[1],
+                         "a_games": games[0], "b_games": games[1]})
+
+
+def load_serve_stats(
+    path_pattern="../../data/tennis_atp_data/unaltered_data/*",
+    regex=r"atp_matches_(199[1-9]|20[0-1][0-9]|202[0-4])\.csv$",
+):
+    """
+    The matches with the serve stats of both players, only those where both
+    served at least one point.
+    """
+    pattern = re.compile(regex)
+    usecols = ["tourney_date", "best_of", "winner_id", "loser_id"] + [
+        f"{side}_{col}" for side in ["w", "l"] for col in SERVE_COLS
+    ]
+    dfs = []
+    for fn in glob.glob(path_pattern):
+        m = pattern.search(os.path.basename(fn))
+        if not m:
+            continue
+        df = pd.read_csv(fn, usecols=usecols)
+        df["year"] = int(m.group(1))
+        dfs.append(df)
+    df = pd.concat(dfs, ignore_index=True).dropna()
+    return df[(df["w_svpt"] > 0) & (df["l_svpt"] > 0)].reset_index(drop=True)
+
+
+class ServeStats:
+    """
+    The serve and return points won of every player, pulled towards the tour
+    average by PRIOR_POINTS.
+    """
+
+    def __init__(self, matches, prior_points=PRIOR_POINTS):
+        # Every match from the view of both players.
+        player = np.r_[matches["winner_id"], matches["loser_id"]]
+        served = np.r_[matches["w_svpt"], matches["l_svpt"]]
+        won = np.r_[matches["w_1stWon"] + matches["w_2ndWon"],
+                    matches["l_1stWon"] + matches["l_2ndWon"]]
+        returned = np.r_[matches["l_svpt"], matches["w_svpt"]]
+        return_won = returned - np.r_[matches["l_1stWon"] + matches["l_2ndWon"],
+                                      matches["w_1stWon"] + matches["w_2ndWon"]]
+        self.serve_avg = won.sum() / served.sum()
+        self.return_avg = 1 - self.serve_avg
+        self.players, codes = np.unique(player.astype(np.int64), return_inverse=True)
+        self.serve = ((np.bincount(codes, won) + prior_points * self.serve_avg)
+                      / (np.bincount(codes, served) + prior_points))
+        self.ret = ((np.bincount(codes, return_won) + prior_points * self.return_avg)
+                    / (np.bincount(codes, returned) + prior_points))
+
+    def _lookup(self, values, avg, player_ids):
+        player_ids = np.asarray(player_ids, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.players, player_ids), len(self.players) - 1)
+        return np.where(self.players[idx] == player_ids, values[idx], avg)
+
+    def serve_probabilities(self, a, b):
+        """
+        The probability that player(s) a wins a point on their serve against
+        b, and that b wins one on their serve against a. Unknown players are
+        average.
+        """
+        serve_a = self._lookup(self.serve, self.serve_avg, a)
+        serve_b = self._lookup(self.serve, self.serve_avg, b)
+        return_a = self._lookup(self.ret, self.return_avg, a)
+        return_b = self._lookup(self.ret, self.return_avg, b)
+        pa = self.serve_avg + (serve_a - self.serve_avg) - (return_b - self.return_avg)
+        pb = self.serve_avg + (serve_b - self.serve_avg) - (return_a - self.return_avg)
+        return np.clip(pa, 0, 1), np.clip(pb, 0, 1)
+
+
+def main():
+    print("Starting the point model…")
+    start = time.perf_counter()
+    for best_of in [3, 5]:
+        match_table(best_of)
+    print(f"\tBuilt the match tables in {time.perf_counter() - start:.2f}s.")
+
+    matches = load_serve_stats()
+    train = matches[matches["year"].isin(TRAIN_YEARS)]
+    test = matches[matches["year"].isin(TEST_YEARS)]
+    stats = ServeStats(train)
+    print(f"\tTour average serve points won: {stats.serve_avg:.3f}")
+
+    # Every test match twice, with the winner as A and with the loser as A.
+    a = np.r_[test["winner_id"], test["loser_id"]]
+    b = np.r_[test["loser_id"], test["winner_id"]]
+    best_of = np.r_[test["best_of"], test["best_of"]]
+    y = np.r_[np.ones(len(test)), np.zeros(len(test))]
+    pa, pb = stats.serve_probabilities(a, b)
+    start = time.perf_counter()
+    p = np.where(best_of == 5, match_probability(pa, pb, 5), match_probability(pa, pb, 3))
+    print(f"\t{len(p)} match probabilities in {(time.perf_counter() - start) * 1e3:.1f}ms.")
+
+    scores = evaluate(y, p)
+    print(f"\tTest years, serve stats of {TRAIN_YEARS[0]}-{TRAIN_YEARS[-1]}:")
+    print(f"\t\taccuracy: {round(scores['accuracy_score'] * 100, 2)}")
+    print(f"\t\tlogloss: {scores['log_loss']}")
+    print(f"\t\tbrier: {scores['brier_score_loss']}")
+    print(f"\t\tauc: {scores['roc_auc_score']}")
+
+    print("Done with the point model!\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
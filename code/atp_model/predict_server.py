@@ -0,0 +1,419 @@
+"""
+This file contains a small local HTTP service that answers questions like
+"what is the chance that A beats B on clay next week" without rerunning
+test_model.py.
+
+At startup formula FORMULA_NO of test_model.py is fitted once on
+filtered_data.csv. Formulas 5 and 6 are the ones that can be served: their
+features are built with numpy by OnlineLogit.featurize() of online_model.py
+instead of patsy, which takes about 10ms for a single row. The coefficients
+are fitted with the Newton-Raphson of code/shared/logit.py on the full data,
+which gives the same probabilities as smf.logit() of test_model.py.
+
+The features of a player as of a date are looked up in a FeatureIndex, built
+from atp_player_pairs_1991_2024.csv: the state of every player after each of
+their matches (win streak, wins and matches per surface, ranking points,
+archetype), sorted per player and date. The latest state before any number of
+(player, date) pairs is a single searchsorted, like the as-of join of
+code/shared/rankings.py. The hand, height and age come from
+code/shared/players.py and names are resolved with code/shared/names.py.
+
+Recent answers are kept in an LRU cache keyed by (p1, p2, surface, date), so
+the same matchup is only computed once. Only the matchups of a request that
+are not in the cache are computed, all of them in one batch.
+
+    python predict_server.py
+    curl "localhost:8000/predict?p1=Sinner&p2=Alcaraz&surface=Clay&date=2024-06-01"
+    curl -d '{"matchups": [{"p1": 206173, "p2": 207989, "surface": "Hard"}]}' \\
+        localhost:8000/predict
+"""
+
+import json
+import sys
+import time
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+
+from load_match_data import FAVOR_BINS, FAVOR_LABELS
+from online_model import OnlineLogit
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.logit import fit_logit  # noqa: E402
+from shared.names import NameIndex, PLAYERS_CSVS  # noqa: E402
+from shared.players import PlayerIndex  # noqa: E402
+from shared.rankings import to_days  # noqa: E402
+
+OUTPUT_DIR = "../../data/tennis_atp_data/altered_data/atp_model"
+TRAIN_FN = f"{OUTPUT_DIR}/filtered_data.csv"
+PAIRS_FN = f"{OUTPUT_DIR}/atp_player_pairs_1991_2024.csv"
+HOST = "127.0.0.1"
+PORT = 8000
+# 5 for rel_ranking_points, 6 for abs_ranking_points.
+FORMULA_NO = 5
+RANKING_COLS = {5: "rel_ranking_points", 6: "abs_ranking_points"}
+CACHE_SIZE = 100_000
+# The surfaces of the model, add_surface_winrates() skips carpet.
+SURFACES = ["Hard", "Clay", "Grass"]
+# Larger than the amount of days between any two dates, see rankings.py.
+SPAN = 1 << 20
+
+
+def parse_date(value):
+    """
+    yyyy-mm-dd or yyyymmdd to a yyyymmdd integer, today if value is empty.
+    Parsed by hand, pd.to_datetime() takes longer than the prediction itself.
+    """
+    digits = str(value or date.today().isoformat()).replace("-", "")
+    if len(digits) != 8 or not digits.isdigit():
+        raise ValueError(f"Dates have to be yyyy-mm-dd or yyyymmdd, not {value}.")
+    return int(digits)
+
+
+class FeatureIndex:
+    """
+    The state of every player after each of their matches, sorted by player
+    and date. players holds the sorted player ids, the states of players[i]
+    are at positions indptr[i] to indptr[i + 1].
+    """
+
+    def __init__(self, pairs):
+        """
+        pairs - DataFrame
+            The player pairs of load_match_data.py, every match twice, once
+            with each player as p1.
+        """
+        df = pairs.assign(day=to_days(pd.to_datetime(pairs["tourney_date"])))
+        df = df.dropna(subset=["p1_id", "day"])
+        df = df.sort_values(["p1_id", "day", "tourney_id", "match_num"], kind="mergesort")
+        player = df["p1_id"].to_numpy(dtype=np.int64)
+        self.players, codes = np.unique(player, return_inverse=True)
+        self.indptr = np.r_[0, np.cumsum(np.bincount(codes))]
+        self.days = df["day"].to_numpy()
+        self.first_day = self.days.min()
+        self.keys = codes * SPAN + (self.days - self.first_day)
+
+        won = df["result"].to_numpy() == 1
+        # p1_streak is the streak before the match.
+        self.streak = np.where(won, df["p1_streak"].to_numpy() + 1, 0)
+        by_player = df.groupby("p1_id", sort=False)
+        self.surface_wins = {}
+        self.surface_matches = {}
+        for surface in SURFACES:
+            on_surface = (df["surface"] == surface).to_numpy()
+            self.surface_matches[surface] = pd.Series(on_surface, index=df.index).groupby(
+                df["p1_id"], sort=False).cumsum().to_numpy()
+            self.surface_wins[surface] = pd.Series(on_surface & won, index=df.index).groupby(
+                df["p1_id"], sort=False).cumsum().to_numpy()
+        # The latest known value, the points or archetype of a match can be
+        # missing.
+        self.ranking_points = by_player["p1_ranking_points"].ffill().to_numpy(dtype=float)
+        self.archetype = by_player["p1_archetype"].ffill().to_numpy(dtype=object)
+
+    @classmethod
+    def from_csv(cls, path=PAIRS_FN):
+        return cls(pd.read_csv(path, usecols=[
+            "tourney_date", "tourney_id", "match_num", "surface", "p1_id",
+            "p1_ranking_points", "result", "p1_archetype", "p1_streak",
+        ]))
+
+    def lookup(self, player_ids, days):
+        """
+        The position of the latest state of every player strictly before
+        days, -1 if the player has no earlier matches.
+        """
+        player_ids = np.asarray(player_ids, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.players, player_ids), len(self.players) - 1)
+        codes = np.where(self.players[idx] == player_ids, idx, -1)
+        known = (codes >= 0) & ~np.isnan(days)
+        query = np.where(known, codes * SPAN + (np.nan_to_num(days) - self.first_day), 0)
+        pos = np.searchsorted(self.keys, query, side="left") - 1
+        # The found state has to be of the same player.
+        ok = known & (pos >= self.indptr[np.maximum(codes, 0)])
+        return np.where(ok, pos, -1)
+
+    def n_matches(self, player_id):
+        i = np.searchsorted(self.players, player_id)
+        if i == len(self.players) or self.players[i] != player_id:
+            return 0
+        return int(self.indptr[i + 1] - self.indptr[i])
+
+    def features(self, player_ids, days, surfaces, prefix):
+        """
+        A dict with {prefix}_streak, {prefix}_surface_winrate,
+        {prefix}_ranking_points and {prefix}_archetype as of days. Players
+        without earlier matches have a streak of 0 and a surface winrate of
+        0.5.
+        """
+        pos = self.lookup(player_ids, days)
+        found = pos >= 0
+        safe = np.maximum(pos, 0)
+        surfaces = np.asarray(surfaces)
+        wins = np.zeros(len(pos))
+        matches = np.zeros(len(pos))
+        for surface in SURFACES:
+            on = found & (surfaces == surface)
+            wins[on] = self.surface_wins[surface][safe[on]]
+            matches[on] = self.surface_matches[surface][safe[on]]
+        return {
+            f"{prefix}_streak": np.where(found, self.streak[safe], 0),
+            # The same smoothed winrate as add_surface_winrates().
+            f"{prefix}_surface_winrate": (wins + 1) / (matches + 2),
+            f"{prefix}_ranking_points": np.where(found, self.ranking_points[safe], np.nan),
+            f"{prefix}_archetype": np.where(found, self.archetype[safe], None),
+        }
+
+
+class LRUCache:
+    """
+    At most size results, the least recently used one is dropped first.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+class Predictor:
+    """
+    The fitted model plus everything needed to build its features for new
+    matchups, this can also be used without the server.
+    """
+
+    def __init__(self, train_df, features, players, names=None, formula_no=FORMULA_NO,
+                 cache_size=CACHE_SIZE):
+        if formula_no not in RANKING_COLS:
+            raise ValueError(f"Only formulas {sorted(RANKING_COLS)} can be served.")
+        self.model = OnlineLogit(ranking_col=RANKING_COLS[formula_no])
+        self.model.fit_features(train_df)
+        self.fit = fit_logit(self.model.featurize(train_df),
+                             train_df["result"].to_numpy(dtype=float))
+        self.features = features
+        self.players = players
+        self.names = names
+        self.cache = LRUCache(cache_size)
+        self._ids = {}
+
+    @classmethod
+    def from_files(cls, formula_no=FORMULA_NO):
+        train_df = pd.read_csv(TRAIN_FN)
+        # Won't touch categories, the same rows as test_model.py.
+        train_df.dropna(inplace=True)
+        return cls(train_df, FeatureIndex.from_csv(), PlayerIndex.from_csv(),
+                   NameIndex.from_csvs({"atp": PLAYERS_CSVS["atp"]}), formula_no)
+
+    def player_id(self, player):
+        """
+        An id as is. A name is resolved with the name index, of the players
+        that match it best the one with the most matches is taken, e.g.
+        "Sinner" is Jannik Sinner and not another player named Sinner.
+        """
+        if isinstance(player, (int, np.integer)) or str(player).isdigit():
+            return int(player)
+        if player not in self._ids:
+            found = self.names.search(player) if self.names is not None else []
+            if len(found) == 0:
+                raise ValueError(f"Unknown player: {player}")
+            best = found[found["score"] == found["score"].max()]
+            matches = [self.features.n_matches(i) for i in best["player_id"]]
+            self._ids[player] = int(best["player_id"].iloc[int(np.argmax(matches))])
+        return self._ids[player]
+
+    def design(self, p1, p2, surfaces, dates):
+        """
+        The rows of the model for matchups, as arrays of p1 and p2 ids,
+        surfaces and yyyymmdd dates.
+        """
+        days = to_days(dates)
+        # A dict of columns that becomes a DataFrame once, inserting columns
+        # one by one costs more than everything else for a few rows.
+        cols = {"surface": surfaces}
+        for prefix, ids in [("p1", p1), ("p2", p2)]:
+            cols.update(self.features.features(ids, days, surfaces, prefix))
+            cols[f"{prefix}_handedness"] = np.asarray(self.players.hands(ids), dtype=object)
+            cols[f"{prefix}_ht"] = self.players.heights(ids)
+            cols[f"{prefix}_age"] = self.players.ages(ids, dates)
+        # The same as add_relative_ranking_points(), add_favor() and
+        # add_absolute_ranking_points(), with the fill values of clean_data.py.
+        p1_points = cols["p1_ranking_points"]
+        p2_points = cols["p2_ranking_points"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel = np.where(p1_points != 0, (p1_points - p2_points) / p1_points, np.nan)
+        # The right edges are part of the bin, like pd.cut.
+        favor = np.clip(np.searchsorted(FAVOR_BINS, rel, side="left") - 1,
+                        0, len(FAVOR_LABELS) - 1)
+        cols["p1_favor"] = np.where(np.isnan(rel), "even", np.array(FAVOR_LABELS)[favor])
+        cols["rel_ranking_points"] = np.nan_to_num(rel, nan=0.0)
+        cols["abs_ranking_points"] = p1_points - p2_points
+        return pd.DataFrame(cols)
+
+    def predict(self, p1, p2, surfaces, dates):
+        """
+        p1, p2 - array
+            Player ids.
+        surfaces - array
+            "Hard", "Clay" or "Grass" per matchup.
+        dates - array
+            yyyymmdd integers, the features are those of before that date.
+
+        Returns the probability that p1 beats p2 per matchup, NaN if the
+        height, age, hand or archetype of one of the players is unknown, or
+        with formula 6 their ranking points. Players with fewer than
+        MIN_MATCHES of rolling_archetypes.py earlier matches do have one, the
+        "Unknown" archetype of load_match_data.py.
+        """
+        p1 = np.asarray(p1, dtype=np.int64)
+        p2 = np.asarray(p2, dtype=np.int64)
+        surfaces = np.asarray(surfaces, dtype=object)
+        dates = np.asarray(dates, dtype=np.int64)
+        keys = list(zip(p1.tolist(), p2.tolist(), surfaces.tolist(), dates.tolist()))
+        cached = [self.cache.get(key) for key in keys]
+        p = np.array([np.nan if x is None else x for x in cached], dtype=float)
+
+        # Only the misses are computed, all at once. Matchups that can't be
+        # predicted are cached as NaN, so they are hits as well.
+        todo = np.array([i for i, x in enumerate(cached) if x is None], dtype=np.int64)
+        if len(todo):
+            df = self.design(p1[todo], p2[todo], surfaces[todo], dates[todo])
+            # The training rows of from_files() never miss any of these, a
+            # missing category would otherwise silently get the reference
+            # level, e.g. the "Balanced" archetype.
+            required = ["p1_ht", "p2_ht", "p1_age", "p2_age", "p1_handedness",
+                        "p2_handedness", "p1_archetype", "p2_archetype",
+                        self.model.ranking_col]
+            ok = ~df[required].isna().any(axis=1).to_numpy()
+            p_todo = np.full(len(todo), np.nan)
+            if ok.any():
+                p_todo[ok] = self.fit.predict(self.model.featurize(df[ok]))
+            p[todo] = p_todo
+            for i, value in zip(todo, p_todo):
+                self.cache.put(keys[i], value)
+        return p
+
+    def predict_matchups(self, matchups):
+        """
+        matchups - list
+            Dicts with p1 and p2 (ids or names), surface and optionally a date
+            (yyyy-mm-dd or yyyymmdd, today if not given).
+
+        Returns a list of dicts with the ids, surface, date and p, the
+        probability that p1 beats p2 (None if it can not be computed).
+        """
+        if not isinstance(matchups, list) or not all(isinstance(m, dict) for m in matchups):
+            raise ValueError("The matchups have to be a list of objects.")
+        if not matchups:
+            return []
+        p1 = [self.player_id(m["p1"]) for m in matchups]
+        p2 = [self.player_id(m["p2"]) for m in matchups]
+        surfaces = [str(m["surface"]).capitalize() for m in matchups]
+        for surface in set(surfaces) - set(SURFACES):
+            raise ValueError(f"Unknown surface {surface}, expected one of {SURFACES}.")
+        ymd = np.array([parse_date(m.get("date")) for m in matchups], dtype=np.int64)
+        if np.isnan(to_days(ymd)).any():
+            raise ValueError("Dates have to be valid yyyy-mm-dd or yyyymmdd dates.")
+        p = self.predict(p1, p2, surfaces, ymd)
+        return [
+            {"p1_id": a, "p2_id": b, "surface": s, "date": int(d),
+             "p": None if np.isnan(x) else float(x)}
+            for a, b, s, d, x in zip(p1, p2, surfaces, ymd, p)
+        ]
+
+
+def make_handler(predictor):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _answer(self, matchups):
+            try:
+                self._send(200, {"predictions": predictor.predict_matchups(matchups)})
+            except KeyError as e:
+                self._send(400, {"error": f"Missing field {e}."})
+            except (TypeError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stats":
+                cache = predictor.cache
+                self._send(200, {"cached": len(cache.items), "hits": cache.hits,
+                                 "misses": cache.misses})
+                return
+            if url.path != "/predict":
+                self._send(404, {"error": "Use /predict or /stats."})
+                return
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            self._answer([query])
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/predict":
+                self._send(404, {"error": "Use /predict."})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            except (TypeError, ValueError):
+                self._send(400, {"error": "The body has to be JSON."})
+                return
+            # Either {"matchups": [...]} or just the list.
+            if isinstance(body, dict):
+                if "matchups" not in body:
+                    self._send(400, {"error": 'The body needs a "matchups" list.'})
+                    return
+                body = body["matchups"]
+            self._answer(body)
+
+        def log_message(self, format, *args):
+            # Printing every request costs more than answering it.
+            pass
+
+    return Handler
+
+
+def main():
+    print("Starting the prediction server…")
+    for fn in [TRAIN_FN, PAIRS_FN]:
+        if not Path(fn).is_file():
+            print(f"\t{fn} Is missing, please run load_match_data.py and clean_data.py first.")
+            return 1
+    start = time.perf_counter()
+    predictor = Predictor.from_files()
+    print(f"\tFitted formula {FORMULA_NO} and built the indexes in "
+          f"{time.perf_counter() - start:.1f}s.")
+    server = HTTPServer((HOST, PORT), make_handler(predictor))
+    print(f"\tListening on http://{HOST}:{PORT}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
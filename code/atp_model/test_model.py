@@ -3,17 +3,25 @@ This file contains the code for training and testing the various tennis
 prediction models.
 """
 
+import sys
 import pandas as pd
 import re
-from scipy.stats import binomtest
 from pathlib import Path
-import statsmodels.formula.api as smf
-from sklearn.metrics import accuracy_score, roc_auc_score, log_loss, brier_score_loss
+
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.formula_search import search, spline_formulas  # noqa: E402
+from shared.logit_cache import LogitCache  # noqa: E402
+from shared.metrics import bootstrap_ci, evaluate  # noqa: E402
 
 # Originally the in- and output was stored within a directory next to the code,
 # but it was decided to seperate data and code.
 OUTPUT_DIR = "../../data/tennis_atp_data/altered_data/atp_model"
 OUT_FN = f"{OUTPUT_DIR}/model_results.csv"
+SEARCH_FN = f"{OUTPUT_DIR}/search_results.csv"
+# If True, the formulas of get_search_formulas() are narrowed down with
+# successive halving on the training years, and only the survivors are tested.
+SEARCH = False
 
 
 def init_out_dir():
@@ -147,32 +155,62 @@ def get_formulas():
     return formulas
 
 
+def get_search_formulas(bounds):
+    """
+    The candidates for SEARCH, the formulas of get_formulas() plus variants of
+    formula 5 with every combination of spline type, degrees of freedom,
+    ranking column and favor interaction.
+
+    bounds - dict
+        (min, max) per spline column, see spline_formulas() of
+        code/shared/formula_search.py.
+    """
+    base = ["C(surface)", "C(p1_handedness)", "C(p2_handedness)", "C(p1_archetype)",
+            "C(p2_archetype)"]
+    options = [
+        ["C(p1_favor) * p1_streak", "C(p1_favor)"],
+        ["rel_ranking_points", "abs_ranking_points"],
+        ["I(p1_surface_winrate - p2_surface_winrate)"],
+        ["I(p1_streak - p2_streak)"],
+    ]
+    return get_formulas() + spline_formulas(
+        "result", [["p1_age", "p2_age"], ["p1_ht", "p2_ht"]], bounds, range(3, 11), base, options
+    )
+
+
 def test(train_df, test_df, formulas):
     rows = []
+    # Nested formulas start at the coefficients of earlier fits.
+    cache = LogitCache(train_df)
     for i, formula in enumerate(formulas):
         print(f"Training and testing formula #{i}…")
-        model = smf.logit(formula, data=train_df).fit()
+        model = cache.fit(formula)
 
         # How probable is our test data according to the model?
         p = model.predict(test_df)
         # print(model.summary())
 
         y = test_df["result"].astype(int).values
-        y_hat = (p >= 0.5).astype(int)
-
-        # How likely would this accuracy be with guesses? Even amount of wins
+        # All metrics in one go, including the binomial test of how likely
+        # this accuracy would be with guesses, i.e. an even amount of wins
         # and losses.
-        k = int((y_hat == y).sum())
-        pval_vs_50 = binomtest(k, len(y), p=0.5, alternative="greater").pvalue
+        scores = evaluate(y, p)
+        ci = bootstrap_ci(y, p)
 
         row = {
             "formula_no": i,
             "formula": formula,
-            "accuracy_score": round(accuracy_score(y, y_hat) * 100, 2),
-            "log_loss": log_loss(y, p),
-            "brier_score_loss": brier_score_loss(y, p),
-            "roc_auc_score": roc_auc_score(y, p),
-            "pval_acc_gt_50": pval_vs_50,
+            "accuracy_score": round(scores["accuracy_score"] * 100, 2),
+            "accuracy_score_ci_lower": round(ci["accuracy_score_ci_lower"] * 100, 2),
+            "accuracy_score_ci_upper": round(ci["accuracy_score_ci_upper"] * 100, 2),
+            "log_loss": scores["log_loss"],
+            "log_loss_ci_lower": ci["log_loss_ci_lower"],
+            "log_loss_ci_upper": ci["log_loss_ci_upper"],
+            "brier_score_loss": scores["brier_score_loss"],
+            "roc_auc_score": scores["roc_auc_score"],
+            "roc_auc_score_ci_lower": ci["roc_auc_score_ci_lower"],
+            "roc_auc_score_ci_upper": ci["roc_auc_score_ci_upper"],
+            "pval_acc_gt_50": scores["pval_acc_gt_50"],
         }
         print(f"\t\taccuracy: {row["accuracy_score"]}")
         print(f"\t\tlogloss: {row["log_loss"]}")
@@ -214,7 +252,15 @@ def main():
     test_df = df.loc[is_test_year].copy()
     print(f"\tTest set length: {len(test_df)}")
     print("\tTest positive rate:", test_df["result"].mean())
-    formulas = get_formulas()
+    if SEARCH:
+        bounds = {
+            col: (float(df[col].min()), float(df[col].max()))
+            for col in ["p1_age", "p2_age", "p1_ht", "p2_ht"]
+        }
+        formulas = search(train_df, train_df["tourney_date"].dt.year,
+                          get_search_formulas(bounds), "result", SEARCH_FN)
+    else:
+        formulas = get_formulas()
 
     rows = test(train_df, test_df, formulas)
     # Otherwise the formula will display like it was defined in get_formulas(),
@@ -228,10 +274,16 @@ def main():
             "formula_no",
             "formula",
             "accuracy_score",
+            "accuracy_score_ci_lower",
+            "accuracy_score_ci_upper",
             "pval_acc_gt_50",
             "log_loss",
+            "log_loss_ci_lower",
+            "log_loss_ci_upper",
             "brier_score_loss",
             "roc_auc_score",
+            "roc_auc_score_ci_lower",
+            "roc_auc_score_ci_upper",
         ]
     ]
 
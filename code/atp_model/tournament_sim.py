@@ -0,0 +1,250 @@
+"""
+This file contains a Monte Carlo simulator of a tournament draw, giving the
+probability that every player reaches every round and wins the title.
+
+The win probability of every pair of players in the draw is computed once, as
+a single batch of the Predictor of predict_server.py. After that no model is
+needed anymore: a block of simulations is an array with a row per simulation
+and the players still alive in draw order, and a round is played for all
+simulations at once by looking up the probabilities of neighbouring players
+in the matrix and comparing them to uniform draws. The blocks are spread over
+processes, a million simulations of a 128 player draw take a few seconds on a
+single core.
+
+The model is trained on all matches, most of which are best of 3. For best of
+5 the match probability p is turned into the probability s of winning a set
+with p = s^2 (3 - 2s), the chance of winning 2 sets before the opponent does,
+and then into the chance of winning 3 sets first with that s.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy.stats import binom
+
+from predict_server import Predictor
+
+OUTPUT_DIR = "../../data/tennis_atp_data/altered_data/atp_model"
+OUT_FN = f"{OUTPUT_DIR}/tournament_odds.csv"
+N_SIMS = 1_000_000
+# Simulations per block, a block of a 128 player draw takes about 25MB.
+BLOCK_SIZE = 100_000
+MODEL_BEST_OF = 3
+ROUND_NAMES = {128: "R128", 64: "R64", 32: "R32", 16: "R16", 8: "QF", 4: "SF", 2: "F",
+               1: "W"}
+# The amount of players of every knockout round, round robins are left out.
+ROUND_SIZES = {name: size for size, name in ROUND_NAMES.items() if size > 1}
+
+
+def init_out_dir():
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+
+
+def win_first(s, sets):
+    """
+    The probability of winning sets sets before the opponent does, with a
+    probability s of winning every set.
+    """
+    # Winning the last set after losing at most sets - 1 of the others.
+    return sum(binom.pmf(lost, sets - 1 + lost, 1 - s) for lost in range(sets)) * s
+
+
+def best_of_probability(p, best_of, model_best_of=MODEL_BEST_OF):
+    """
+    Converts the match probabilities p of a best of model_best_of match into
+    those of a best of best_of match, assuming independent sets.
+    """
+    p = np.asarray(p, dtype=float)
+    if best_of == model_best_of:
+        return p
+    # win_first() increases with s, so its inverse is an interpolation of a
+    # fine grid.
+    grid = np.linspace(0, 1, 2001)
+    s = np.interp(p, win_first(grid, (model_best_of + 1) // 2), grid)
+    return win_first(s, (best_of + 1) // 2)
+
+
+def probability_matrix(predictor, draw, surface, date, best_of=MODEL_BEST_OF):
+    """
+    draw - list
+        The player ids in draw order, the first plays the second and so on.
+        None is a bye, which loses every match.
+    date - int
+        yyyymmdd, the players are taken as they were right before it.
+
+    Returns a matrix with the probability that player i beats player j. Both
+    orders of every pair are predicted and averaged, so P[i, j] + P[j, i] is
+    1. Pairs the model can't predict, e.g. because of a missing height, get
+    0.5.
+    """
+    n = len(draw)
+    ids = np.array([-1 if d is None else d for d in draw], dtype=np.int64)
+    i, j = np.triu_indices(n, 1)
+    real = (ids[i] >= 0) & (ids[j] >= 0)
+    p = np.full(len(i), 0.5)
+    pi, pj = ids[i[real]], ids[j[real]]
+    dates = np.full(len(pi), date, dtype=np.int64)
+    surfaces = np.full(len(pi), surface, dtype=object)
+    both = predictor.predict(np.r_[pi, pj], np.r_[pj, pi], np.r_[surfaces, surfaces],
+                             np.r_[dates, dates])
+    p_real = (both[:len(pi)] + 1 - both[len(pi):]) / 2
+    unknown = np.isnan(p_real)
+    if unknown.any():
+        print(f"\t{unknown.sum()} of {len(p_real)} pairs can not be predicted, they get 0.5.")
+    p[real] = np.where(unknown, 0.5, p_real)
+    p = best_of_probability(p, best_of)
+    # A bye loses against a player and the first of two byes goes through.
+    p[(ids[i] < 0) & (ids[j] >= 0)] = 0
+    p[(ids[i] >= 0) & (ids[j] < 0)] = 1
+    p[(ids[i] < 0) & (ids[j] < 0)] = 1
+
+    P = np.full((n, n), 0.5)
+    P[i, j] = p
+    P[j, i] = 1 - p
+    return P
+
+
+def simulate_block(P, n_sims, seed):
+    """
+    Plays n_sims brackets with the probabilities P. Returns an array with per
+    round r (0 is the first round) the amount of simulations every player won
+    their match in that round.
+    """
+    n = len(P)
+    rng = np.random.default_rng(seed)
+    flat = P.astype(np.float32).ravel()
+    alive = np.broadcast_to(np.arange(n, dtype=np.int32), (n_sims, n))
+    wins = []
+    while alive.shape[1] > 1:
+        a = alive[:, 0::2]
+        b = alive[:, 1::2]
+        # The probabilities of all matches of the round of all simulations.
+        a_wins = rng.random(a.shape, dtype=np.float32) < flat[a * n + b]
+        alive = np.where(a_wins, a, b)
+        wins.append(np.bincount(alive.ravel(), minlength=n))
+    return np.array(wins)
+
+
+def simulate(P, n_sims=N_SIMS, seed=0, n_jobs=None, block_size=BLOCK_SIZE):
+    """
+    Plays n_sims brackets in blocks of block_size, spread over n_jobs
+    processes (None uses all cores). Every block gets its own random stream
+    spawned from seed, so the result does not depend on n_jobs.
+
+    Returns the fraction of simulations every player won their match of
+    every round, with a row per round.
+    """
+    n = len(P)
+    if n < 2 or n & (n - 1):
+        raise ValueError(f"The draw needs a power of 2 players, not {n}, use None for byes.")
+    sizes = [block_size] * (n_sims // block_size)
+    if n_sims % block_size:
+        sizes.append(n_sims % block_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, len(sizes))
+    if n_jobs <= 1:
+        wins = [simulate_block(P, size, s) for size, s in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            wins = list(pool.map(simulate_block, [P] * len(sizes), sizes, seeds))
+    return np.sum(wins, axis=0) / n_sims
+
+
+def tournament_odds(predictor, draw, surface, date, best_of=MODEL_BEST_OF, n_sims=N_SIMS,
+                    seed=0, n_jobs=None):
+    """
+    Returns a DataFrame with a row per player of draw (without the byes) and
+    the probability of reaching every round, ROUND_NAMES, the last column W
+    is the probability of winning the title. Sorted by that probability.
+    """
+    P = probability_matrix(predictor, draw, surface, date, best_of)
+    won = simulate(P, n_sims, seed, n_jobs)
+    n = len(draw)
+    out = pd.DataFrame({"player_id": draw, "draw_position": np.arange(n)})
+    # Winning a match of round r means reaching the round with half the
+    # players.
+    for r in range(len(won)):
+        remaining = n >> (r + 1)
+        out[ROUND_NAMES.get(remaining, f"R{remaining}")] = won[r]
+    out = out.dropna(subset=["player_id"])
+    out["player_id"] = out["player_id"].astype(np.int64)
+    return out.sort_values("W", ascending=False).reset_index(drop=True)
+
+
+def load_draw(matches_csv, tourney_name):
+    """
+    The draw of a tournament in a match file, rebuilt from its results: the
+    final is played between the winners of the two halves of the draw, the
+    winner of a half beat the winners of its two quarters and so on. Halves
+    are in order of the match_num of the match that decided them, the winner
+    of a first round match comes first. The first round match_nums alone don't
+    always follow the bracket.
+
+    Draws that aren't a power of 2, e.g. 28, 48 or 96 players, are padded with
+    byes: a player without a first round match gets a None next to them.
+
+    Returns the player ids, surface, best_of and tourney_date.
+    """
+    df = pd.read_csv(matches_csv)
+    df = df[(df["tourney_name"] == tourney_name) & df["round"].isin(ROUND_SIZES)]
+    final = df[df["round"] == "F"]
+    if len(final) != 1:
+        raise ValueError(f"{tourney_name} has no final, the draw can't be rebuilt.")
+    n = int(df["round"].map(ROUND_SIZES).max())
+    # The opponent and match_num of every player in every round.
+    played = {}
+    for r, w, lo, num in zip(df["round"], df["winner_id"], df["loser_id"], df["match_num"]):
+        played[(ROUND_SIZES[r], w)] = (lo, num)
+        played[(ROUND_SIZES[r], lo)] = (w, num)
+
+    def section(player, size):
+        # The slots of the section of size slots won by player, and the
+        # match_num of its last match.
+        if size == 1:
+            return [player], -1
+        found = played.get((2 * n // size, player))
+        if found is None:
+            if size == 2:
+                return [player, None], -1
+            raise ValueError(f"{tourney_name} misses the round of {2 * n // size} match "
+                             f"of {player}.")
+        opponent, num = found
+        halves = sorted([section(player, size // 2), section(opponent, size // 2)],
+                        key=lambda half: half[1])
+        return halves[0][0] + halves[1][0], num
+
+    draw, _ = section(final["winner_id"].iloc[0], n)
+    row = final.iloc[0]
+    return draw, row["surface"], int(row["best_of"]), int(row["tourney_date"])
+
+
+def main():
+    print("Starting the tournament simulation…")
+    init_out_dir()
+    draw, surface, best_of, date = load_draw(
+        "../../data/tennis_atp_data/unaltered_data/atp_matches_2024.csv", "Us Open"
+    )
+    print(f"\tUS Open 2024, {len(draw)} players, {surface}, best of {best_of}.")
+    # The features are those of before date, so the matches of the
+    # tournament itself are not known.
+    predictor = Predictor.from_files()
+
+    start = time.perf_counter()
+    odds = tournament_odds(predictor, draw, surface, date, best_of)
+    print(f"\t{N_SIMS} simulations in {time.perf_counter() - start:.1f}s.")
+    print(odds.head(10).to_string(index=False))
+    print(f"\tWriting the odds to {OUT_FN}")
+    odds.to_csv(OUT_FN, index=False)
+
+    print("Done with the tournament simulation!\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -8,6 +8,8 @@ import numpy as np
 import re
 import glob
 import os.path
+import sys
+from pathlib import Path
 
 from matplotlib import pyplot as plt
 from sklearn.linear_model import LogisticRegression
@@ -15,11 +17,20 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import confusion_matrix, accuracy_score, roc_auc_score
 import statsmodels.api as sm
 
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.smoothing import binned_lowess  # noqa: E402
+from shared.rankings import RankingStore  # noqa: E402
+
 # list of the experiments you want to run. Valid experiment numbers are 1, 2 and 3
 EXPERIMENT_NO = [2]
 PLOT_DATA = True
+# Fills in the missing ranking points of the matches with the latest weekly
+# ranking before the tournament, from the atp_rankings_*.csv files.
+ASOF_RANKINGS = False
+RANKINGS_GLOB = "./data/tennis_atp_data/unaltered_data/atp_rankings_*.csv"
 
-USE_COLS = ["tourney_id", "tourney_name", "match_num",
+USE_COLS = ["tourney_id", "tourney_name", "tourney_date", "match_num",
             "winner_id", "winner_rank", "winner_rank_points",
             "loser_id", "loser_rank", "loser_rank_points"]
 
@@ -65,6 +76,23 @@ def load_tennis_data(
     return pd.concat(csvs, ignore_index=True)
 
 
+def fill_rank_points(df, store):
+    """
+    df - DataFrame
+        The matches, with tourney_date.
+    store - RankingStore
+
+    Returns df where missing winner/loser_rank_points are replaced by the
+    points of the as-of ranking of that player, if there is one.
+    """
+    df = df.copy()
+    for side in ["winner", "loser"]:
+        _, points = store.asof(df[f"{side}_id"], df["tourney_date"])
+        points = pd.Series(points, index=df.index)
+        df[f"{side}_rank_points"] = df[f"{side}_rank_points"].fillna(points)
+    return df
+
+
 def log_reg(df, x_col_name, y_col_name, exp_no=None, plot=True):
     # Optional scatter plot
     if plot:
@@ -165,8 +193,9 @@ def plot_prob_vs_diff_lowess(df, x_col="dif_score", y_col="playerA_win", frac=0.
     x = df[x_col].values
     y = df[y_col].values
 
-    lowess = sm.nonparametric.lowess
-    smoothed = lowess(y, x, frac=frac)
+    # Exact LOWESS over every match took ages, the binned version is within
+    # about 0.001 of it and takes a fraction of a second.
+    smoothed = binned_lowess(y, x, frac=frac)
 
     plt.figure(figsize=(7, 5))
     plt.scatter(x, y, alpha=0.2, s=10, color='gray', label='Raw data')
@@ -232,7 +261,10 @@ def experiment3(tennis_df, plot=True):
 
 def main():
     tennis_df = load_tennis_data(path_pattern="./data/tennis_atp_data/unaltered_data/*",
-                                 usecols=USE_COLS).dropna()
+                                 usecols=USE_COLS)
+    if ASOF_RANKINGS:
+        tennis_df = fill_rank_points(tennis_df, RankingStore.from_files(RANKINGS_GLOB))
+    tennis_df = tennis_df.dropna()
 
     if len(EXPERIMENT_NO) == 0 or len(EXPERIMENT_NO) > 3:
         raise Exception("Invalid EXPERIMENT_NO length")
@@ -2,19 +2,30 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os.path
+import sys
+from pathlib import Path
 
-from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import confusion_matrix, accuracy_score, roc_auc_score
 import statsmodels.api as sm
 
-from collections import defaultdict
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.rates import conditional_rates  # noqa: E402
+from shared.stratified import fit_strata  # noqa: E402
 
 RANDOM_SEED = 1
 
 EXPERIMENT_NO = [1, 2, 3]
 PLOT_DATA = True
 
+SKILL_BINS = ["heavy_underdog", "moderate_underdog", "slight_underdog", "even",
+              "slight_favorite", "moderate_favorite", "heavy_favorite"]
+# The columns that define a stratum in experiment 3, every stratum gets its
+# own logistic regression. More columns (e.g. surface or tier, once they are
+# in experiment3_data.csv) only add strata, they are all fitted in parallel.
+STRATA = ["skill_bin"]
+
 
 def log_reg(df, x_col_name, y_col_name, exp_no=None, plot=True):
     # Optional scatter plot
@@ -35,11 +46,8 @@ def log_reg(df, x_col_name, y_col_name, exp_no=None, plot=True):
         x_val, y_val, test_size=0.3, random_state=RANDOM_SEED
     )
 
-    # sklearn logistic regression
-    log_reg_model = LogisticRegression()
-    log_reg_model.fit(train_x, train_y)
-
-    # NHST using statsmodels
+    # NHST using statsmodels, its predictions are used as well so there is no
+    # need to fit the same model again with sklearn.
     X_sm = sm.add_constant(train_x)  # add intercept
     model_sm = sm.Logit(train_y, X_sm).fit(disp=False)
     summary_table = model_sm.summary2().tables[1]  # coefficient table with p-values
@@ -51,13 +59,12 @@ def log_reg(df, x_col_name, y_col_name, exp_no=None, plot=True):
     print(f"Results experiment {exp_no}")
     print("______________________________________\n")
 
-    # sklearn results
-    print("Sklearn logistic regression:")
-    print(f"Beta-coef: {log_reg_model.coef_}")
-    print(f"Intercept: {log_reg_model.intercept_}")
+    print("Logistic regression:")
+    print(f"Beta-coef: {model_sm.params.iloc[1:].to_numpy()}")
+    print(f"Intercept: {model_sm.params.iloc[0]}")
 
-    pred_y = log_reg_model.predict(test_x)
-    pred_prob = log_reg_model.predict_proba(test_x)[:, 1]
+    pred_prob = model_sm.predict(sm.add_constant(test_x, has_constant="add"))
+    pred_y = (pred_prob >= 0.5).astype(int)
 
     print(f"\nConfusion mat:\n{confusion_matrix(test_y, pred_y)}\n")
     print(f"Accuracy: {accuracy_score(test_y, pred_y):.3f}")
@@ -107,24 +114,27 @@ def experiment1(df, plot=True):
 # given that you are on a certain win streak.
 # For this I will calculate win-coefficient per win streak.
 # This will give a nice plot hopefully, showing increased odds for higher streaks.
-def experiment2_1(df):
-    # count all the streaks and how they translate to wins/losses
-    wins_on_streak = defaultdict(int)
-    loss_on_streak = defaultdict(int)
+def streak_rates(df):
+    """
+    Wins and losses per win streak, every match counts as a win for the
+    winner's streak and a loss for the loser's streak.
+    """
+    streaks = pd.concat([df["winner_streak"], df["loser_streak"]])
+    outcomes = np.concatenate((np.ones(len(df)), np.zeros(len(df))))
+    return conditional_rates(streaks.to_numpy(), outcomes)
 
-    for _, row in df.iterrows():
-        wins_on_streak[str(row["winner_streak"])] += 1
-        loss_on_streak[str(row["loser_streak"])] += 1
 
-    # calculate coefficients per streak
-    max_streak = max(pd.concat([df["winner_streak"], df["loser_streak"]]))
-    streaks = np.arange(max_streak)
-    win_coef = []
-    for streak in streaks:
-        win_coef.append(wins_on_streak[str(streak)] / (wins_on_streak[str(streak)] +
-                                                       loss_on_streak[str(streak)]))
-
-    plt.plot(streaks, win_coef)
+def experiment2_1(df):
+    # count all the streaks and how they translate to wins/losses
+    rates = streak_rates(df)
+    rates = rates[rates["n"] > 0]
+
+    plt.plot(rates["key"], rates["rate"])
+    # Wilson intervals, so the long streaks with only a few matches don't
+    # look more meaningful than they are.
+    plt.fill_between(rates["key"], rates["ci_lower"], rates["ci_upper"], alpha=0.2,
+                     label="95% CI")
+    plt.legend()
     plt.title("Win Rate per Win Streak")
     plt.xlabel("Win Streak")
     plt.ylabel("Win Rate")
@@ -138,22 +148,15 @@ def experiment2_1(df):
 def experiment2_2(df):
     # win/loss ratio, laplace smoothed
     # count all the streaks and how they translate to wins/losses
-    wins_on_streak = defaultdict(int)
-    loss_on_streak = defaultdict(int)
-
-    for _, row in df.iterrows():
-        wins_on_streak[str(row["winner_streak"])] += 1
-        loss_on_streak[str(row["loser_streak"])] += 1
+    rates = streak_rates(df)
+    rates = rates[rates["n"] > 0]
 
     # calculate coefficients per streak
-    max_streak = max(pd.concat([df["winner_streak"], df["loser_streak"]]))
-    streaks = np.arange(max_streak)
-    win_coef = []
     eps = 1
-    for streak in streaks:
-        win_coef.append(wins_on_streak[str(streak)] / (eps + loss_on_streak[str(streak)]))
+    losses = rates["n"] - rates["successes"]
+    win_coef = rates["successes"] / (eps + losses)
 
-    plt.plot(streaks, win_coef)
+    plt.plot(rates["key"], win_coef)
     plt.title("Win/Loss ratio per Win streak")
     plt.xlabel("Win streak")
     plt.ylabel("W/L ratio")
@@ -203,22 +206,14 @@ def experiment3_clean_and_bin(df):
 def experiment3_1():
     df = pd.read_csv("./data/tennis_atp_data/altered_data/win_streak/experiment3_data.csv")
 
-    # List of skill bins
-    skill_bins = ["heavy_underdog", "moderate_underdog", "slight_underdog", "even",
-                  "slight_favorite", "moderate_favorite", "heavy_favorite"]
-
-    # Dictionary to store results
-    models = {}
+    # Logistic regression per skill bin, very small bins are skipped.
+    models, coef_table = fit_strata(df, "playerA_win", ["playerA_streak"], STRATA,
+                                    min_rows=10)
+    print(coef_table.to_string(index=False))
 
-    # Logistic regression per skill bin
-    for bin_name in skill_bins:
-        bin_data = df[df['skill_bin'] == bin_name]
-        if len(bin_data) < 10:  # Skip very small bins
-            continue
-        X = sm.add_constant(bin_data['playerA_streak'])  # Add intercept
-        y = bin_data['playerA_win']
-        model = sm.Logit(y, X).fit(disp=0)
-        models[bin_name] = model
+    # In the order of the skill bins, so the legend is too.
+    if STRATA == ["skill_bin"]:
+        models = {name: models[name] for name in SKILL_BINS if name in models}
 
     return models, df
 
@@ -248,13 +243,43 @@ def plot_experiment3_1(df, models):
 
 def experiment3_2(plot=True):
     df = pd.read_csv("./data/tennis_atp_data/altered_data/win_streak/experiment3_data.csv")
-    skill_bins = ["heavy_underdog", "moderate_underdog", "slight_underdog", "even",
-                  "slight_favorite", "moderate_favorite", "heavy_favorite"]
 
-    for skill_bin in skill_bins:
-        bin_data = df[df['skill_bin'] == skill_bin]
-        print(f"----------------------\n{skill_bin}\n----------------------\n")
-        log_reg(bin_data, "playerA_streak", "playerA_win", plot=plot, exp_no={skill_bin})
+    # Every bin gets its own 70/30 split, the same one as splitting the bin
+    # on its own. Then all bins are fitted on their training rows at once.
+    bins = {}
+    for key, bin_data in df.groupby(STRATA, observed=True):
+        stratum = key[0] if len(STRATA) == 1 else key
+        bins[stratum] = (key, bin_data) + tuple(
+            train_test_split(bin_data, test_size=0.3, random_state=RANDOM_SEED)
+        )
+    train_df = pd.concat([train_bin for _, _, train_bin, _ in bins.values()])
+    models, coef_table = fit_strata(train_df, "playerA_win", ["playerA_streak"], STRATA)
+    # In the order of the skill bins, like experiment3_1().
+    if STRATA == ["skill_bin"]:
+        models = {name: models[name] for name in SKILL_BINS if name in models}
+
+    for stratum in models:
+        key, bin_data, _, test_bin = bins[stratum]
+        print(f"----------------------\n{stratum}\n----------------------\n")
+        if plot:
+            plt.figure(figsize=(6, 4))
+            plt.scatter(bin_data["playerA_streak"], bin_data["playerA_win"], alpha=0.5)
+            plt.xlabel("playerA_streak")
+            plt.ylabel("playerA_win")
+            plt.title(f"playerA_win vs playerA_streak ({stratum})")
+            plt.show()
+
+        test_y = test_bin["playerA_win"].to_numpy()
+        pred_prob = models[stratum].predict(
+            sm.add_constant(test_bin["playerA_streak"].to_numpy(), has_constant="add")
+        )
+        pred_y = (pred_prob >= 0.5).astype(int)
+
+        in_bin = [tuple(row) == key for row in coef_table[STRATA].itertuples(index=False)]
+        print(coef_table[in_bin].to_string(index=False))
+        print(f"\nConfusion mat:\n{confusion_matrix(test_y, pred_y)}\n")
+        print(f"Accuracy: {accuracy_score(test_y, pred_y):.3f}")
+        print(f"ROC-AUC: {roc_auc_score(test_y, pred_prob):.3f}\n")
 
 
 def main():
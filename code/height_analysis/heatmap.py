@@ -2,13 +2,23 @@
 This code was generated by ChatGPT. It was usedd to test generating heatmaps
 based on predictions by a logistic regression model. The idea was to analyse
 specific matchups.
+
+The predictions are made with ScenarioGrid from code/shared/scenario_grid.py
+instead of model.predict() on a meshgrid, pass the same grid to every call to
+reuse the terms it already computed, e.g. for a heatmap per age or surface.
 """
 
+import sys
+from pathlib import Path
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import statsmodels.formula.api as smf
 
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.scenario_grid import ScenarioGrid  # noqa: E402
+
 
 def matchup_heatmap(
     model,
@@ -22,18 +32,12 @@ def matchup_heatmap(
     vmin=None,
     vmax=None,
     clip_quantiles=None,
+    grid=None,
 ):
-    X, Y = np.meshgrid(x_vals, y_vals)
-
-    grid = pd.DataFrame(
-        {
-            xcol: X.ravel(),
-            ycol: Y.ravel(),
-            **{k: np.full(X.size, v) for k, v in fixed.items()},
-        }
-    )
-
-    P = model.predict(grid).to_numpy().reshape(len(y_vals), len(x_vals))
+    if grid is None:
+        grid = ScenarioGrid(model)
+    # Rows are y_vals and columns x_vals, like the meshgrid before.
+    P = grid.evaluate({ycol: y_vals, xcol: x_vals}, fixed)
 
     if clip_quantiles is not None:
         qlo, qhi = clip_quantiles
@@ -60,28 +64,33 @@ def matchup_heatmap(
     plt.close(fig)
 
 
-# ---- main ----
-df = pd.read_csv("csv/logit.csv").copy()
+def main():
+    df = pd.read_csv("csv/logit.csv").copy()
 
-# numeric + drop missing
-for c in ["p1_ht", "p2_ht", "win"]:
-    df[c] = pd.to_numeric(df[c], errors="coerce")
-df = df.dropna(subset=["p1_ht", "p2_ht", "win"])
+    # numeric + drop missing
+    for c in ["p1_ht", "p2_ht", "win"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df = df.dropna(subset=["p1_ht", "p2_ht", "win"])
 
-# Fit: probability depends on height difference
-model = smf.logit("win ~ I(p1_ht - p2_ht)", data=df).fit()
+    # Fit: probability depends on height difference
+    model = smf.logit("win ~ I(p1_ht - p2_ht)", data=df).fit()
 
-# Heatmap ranges
-ht_vals = np.arange(160, 201, 1)
+    # Heatmap ranges
+    ht_vals = np.arange(160, 201, 1)
 
-matchup_heatmap(
-    model,
-    xcol="p1_ht",
-    ycol="p2_ht",
-    x_vals=ht_vals,
-    y_vals=ht_vals,
-    fixed={},  # no other covariates
-    title="Height matchup heatmap (p1_ht vs p2_ht)",
-    out_png="png/heatmap_height_160_200.png",
-    clip_quantiles=(0.02, 0.98),
-)
+    matchup_heatmap(
+        model,
+        xcol="p1_ht",
+        ycol="p2_ht",
+        x_vals=ht_vals,
+        y_vals=ht_vals,
+        fixed={},  # no other covariates
+        title="Height matchup heatmap (p1_ht vs p2_ht)",
+        out_png="png/heatmap_height_160_200.png",
+        clip_quantiles=(0.02, 0.98),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
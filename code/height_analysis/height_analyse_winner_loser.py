@@ -6,15 +6,24 @@ winners and mean height of losers of the main tier per year, as well as code
 to see if it is statistically significant.
 """
 
-import numpy as np
 import pandas as pd
+import sys
 from pathlib import Path
 import matplotlib.pyplot as plt
 
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.bootstrap import grouped_mean_ci  # noqa: E402
+
 # Originally the in- and output was stored within a directory next to the code,
 # but it was decided to seperate data and code.
 CSV_DIR = "../../data/tennis_atp_data/altered_data/height_analysis"
 PNG_DIR = "../../graphs/height_analysis"
+# If True the players of a year are resampled, each with all of their matches
+# of that year, instead of the matches themselves. This keeps the matches of
+# the same player together, which makes the CIs wider but more honest. Off by
+# default, so the yearly CIs stay the match resampled ones of before.
+CLUSTER = False
 
 
 def init_out_dir():
@@ -38,8 +47,6 @@ def main():
     # keep only main tier
     main = df[df["tier"] == "main"].copy()
 
-    # It shouldn't matter but it is nicer to have perfectly consistent plots.
-    rng = np.random.default_rng(0)
     rows = []
     # Amount of bootstrap samples. We have to use bootstrapping since heights
     # of the same players across different matches are not independent of
@@ -48,7 +55,23 @@ def main():
     # Since we use 95% CI.
     alpha = 0.05
 
-    for year, group in main.groupby("year"):
+    groups = list(main.groupby("year"))
+    # The mean of the differences is the difference of the means, so each
+    # match is reduced to a single number before resampling. All years are
+    # bootstrapped at once, the seed keeps the plots consistent.
+    cis = grouped_mean_ci(
+        [(group["winner_ht"] - group["loser_ht"]).to_numpy() for _, group in groups],
+        n_boot=N,
+        alpha=alpha,
+        seed=0,
+        clusters=(
+            [group[["winner_id", "loser_id"]].to_numpy() for _, group in groups]
+            if CLUSTER
+            else None
+        ),
+    )
+
+    for (year, group), (ci_lower, ci_upper) in zip(groups, cis):
         winner_ht = group["winner_ht"].to_numpy()
         loser_ht = group["loser_ht"].to_numpy()
         # Amount of matches
@@ -58,19 +81,6 @@ def main():
         # is so it is not some numpy datatype.
         diff_mean = float(winner_ht.mean() - loser_ht.mean())
 
-        boots = np.empty(N)
-        idx = np.arange(n)
-        for b in range(N):
-            # Sample with replacement.
-            s = rng.choice(idx, size=n, replace=True)
-            # Compute the bootstrapped difference in mean.
-            boots[b] = winner_ht[s].mean() - loser_ht[s].mean()
-
-        # The lower 2.5%
-        ci_lower = float(np.quantile(boots, alpha / 2))
-        # The upper 97.5%
-        ci_upper = float(np.quantile(boots, 1 - alpha / 2))
-
         rows.append(
             {
                 "year": int(year),
@@ -83,6 +93,20 @@ def main():
 
     out = pd.DataFrame(rows).sort_values("year").reset_index(drop=True)
 
+    # The whole main tier history at once, resampling the players.
+    ((all_lower, all_upper),) = grouped_mean_ci(
+        [(main["winner_ht"] - main["loser_ht"]).to_numpy()],
+        n_boot=N,
+        alpha=alpha,
+        seed=0,
+        clusters=[main[["winner_id", "loser_id"]].to_numpy()],
+    )
+    all_diff = float(main["winner_ht"].mean() - main["loser_ht"].mean())
+    print(
+        f"\tAll years: difference in mean {all_diff:.3f}, "
+        f"player clustered 95% CI [{all_lower:.3f}, {all_upper:.3f}]"
+    )
+
     print(f"\tWriting the analysis result to {PNG_DIR}/winner_loser_ht_mean.png")
     out.to_csv(f"{CSV_DIR}/winner_loser_ht_mean.csv", index=False)
     fig, ax = plt.subplots(figsize=(12, 8))
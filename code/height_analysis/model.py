@@ -5,16 +5,24 @@ This file contains the code to train and test different logistic regression
 models based on the height data of our dataset.
 """
 
+import sys
 import pandas as pd
 import re
-import statsmodels.formula.api as smf
-from sklearn.metrics import accuracy_score, roc_auc_score, log_loss, brier_score_loss
 from pathlib import Path
 
+# The shared helpers live in code/shared, next to this directory.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.formula_search import pair_formulas, search  # noqa: E402
+from shared.logit_cache import LogitCache  # noqa: E402
+from shared.metrics import METRICS, bootstrap_ci, evaluate  # noqa: E402
+
 
 # Originally the in- and output was stored within a directory next to the code,
 # but it was decided to seperate data and code.
 CSV_DIR = "../../data/tennis_atp_data/altered_data/height_analysis"
+# If True, the formulas of get_search_formulas() are narrowed down with
+# successive halving on the training years, and only the survivors are tested.
+SEARCH = False
 
 
 def init_out_dir():
@@ -67,26 +75,32 @@ def get_formulas():
     return formulas
 
 
+def get_search_formulas(ht_min, ht_max):
+    """
+    The candidates for SEARCH, the formulas of get_formulas() plus every
+    combination of spline type, degrees of freedom and year term, see
+    pair_formulas() of code/shared/formula_search.py.
+    """
+    return get_formulas() + pair_formulas("win", "p1_ht", "p2_ht", "dh", ht_min, ht_max)
+
+
 def test(train_df, test_df, formulas):
     rows = []
+    # Nested formulas start at the coefficients of earlier fits.
+    cache = LogitCache(train_df)
     for formula in formulas:
         print(f"\tFormula: {formula}")
-        model = smf.logit(formula, data=train_df).fit()
+        model = cache.fit(formula)
 
         # How probable is our test data according to the model?
         p = model.predict(test_df)
         # print(model.summary())
 
         y = test_df["win"].astype(int).values
-        y_hat = (p >= 0.5).astype(int)
-
-        row = {
-            "formula": formula,
-            "accuracy_score": accuracy_score(y, y_hat),
-            "log_loss": log_loss(y, p),
-            "brier_score_loss": brier_score_loss(y, p),
-            "roc_auc_score": roc_auc_score(y, p),
-        }
+        row = {"formula": formula}
+        row.update(evaluate(y, p))
+        # 95% CIs of the metrics, bootstrapped over the test rows.
+        row.update(bootstrap_ci(y, p))
         print(f"\t\taccuracy: {round(row["accuracy_score"] * 100, 2)}")
         print(f"\t\tlogloss: {row["log_loss"]}")
         print(f"\t\tbrier: {row["brier_score_loss"]}")
@@ -118,6 +132,9 @@ def main():
         f"{((len_raw - len_non_na) / len_raw * 100):.1f}%."
     )
 
+    ht_min = float(df[["p1_ht", "p2_ht"]].min().min())
+    ht_max = float(df[["p1_ht", "p2_ht"]].max().max())
+
     # This can be done inside the formulas, but far more convenient to just make
     # columns derived from the data.
     df["dh"] = df["p1_ht"] - df["p2_ht"]
@@ -138,7 +155,11 @@ def main():
 
     train_df = df.loc[is_train_year].copy()
     test_df = df.loc[is_test_year].copy()
-    formulas = get_formulas()
+    if SEARCH:
+        formulas = search(train_df, train_df["year"], get_search_formulas(ht_min, ht_max), "win",
+                          f"{CSV_DIR}/search_results.csv")
+    else:
+        formulas = get_formulas()
 
     rows = test(train_df, test_df, formulas)
     # Otherwise the formula will display like it was defined in get_formulas(),
@@ -147,9 +168,10 @@ def main():
         row["formula"] = re.sub(r"\s+", " ", row["formula"]).strip()
     results_df = pd.DataFrame(rows)
 
-    results_df = results_df[
-        ["formula", "accuracy_score", "log_loss", "brier_score_loss", "roc_auc_score"]
-    ]
+    columns = ["formula"]
+    for metric in METRICS:
+        columns += [metric, f"{metric}_ci_lower", f"{metric}_ci_upper"]
+    results_df = results_df[columns]
 
     print(f"\tWriting the result to {CSV_DIR}/model_results.csv")
     results_df.to_csv(f"{CSV_DIR}/model_results.csv", index=False)
@@ -0,0 +1,158 @@
+"""
+This file contains a bootstrap of the mean for many groups at once, e.g. one
+group per year. Instead of drawing one resample at a time in a Python loop,
+the indices of many resamples are drawn as one block and their means are
+computed with a single gather and row sum. The groups are spread over
+processes.
+
+Every group gets its own random stream derived from the seed, so the results
+only depend on the seed and not on the amount of processes or the order in
+which they finish.
+
+Observations can also be resampled in clusters, e.g. players, since the
+matches of the same player are not independent. A match belongs to both of
+its players, so it is drawn once for every draw of either player. The
+matches of every cluster are found through a CSR index, like scipy's sparse
+matrices: the observations of cluster j are indices[indptr[j]:indptr[j + 1]].
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Amount of drawn indices per block, limits the memory use to roughly
+# BLOCK_SIZE * 12 bytes, the indices plus the gathered values.
+BLOCK_SIZE = 2**22
+
+
+def bootstrap_means(values, n_boot, rng, block_size=BLOCK_SIZE):
+    """
+    values - array
+        The 1d sample.
+    n_boot - int
+        Amount of bootstrap resamples.
+    rng - np.random.Generator
+
+    Returns an array with the mean of each of the n_boot resamples.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    n = len(values)
+    if n == 0:
+        return np.full(n_boot, np.nan)
+    # Smaller indices are quicker to draw and to gather with.
+    dtype = np.uint16 if n <= np.iinfo(np.uint16).max else np.int64
+    batch = max(1, block_size // n)
+
+    means = np.empty(n_boot)
+    done = 0
+    while done < n_boot:
+        b = min(batch, n_boot - done)
+        # One row per resample, drawn with replacement.
+        idx = rng.integers(0, n, size=(b, n), dtype=dtype)
+        means[done:done + b] = np.take(values, idx).mean(axis=1)
+        done += b
+    return means
+
+
+def cluster_index(labels):
+    """
+    labels - array
+        The cluster of every observation, or one column per cluster an
+        observation belongs to, e.g. the winner and loser id of a match.
+
+    Returns the unique clusters and the CSR index (indptr, indices) of their
+    observations.
+    """
+    labels = np.asarray(labels)
+    if labels.ndim == 1:
+        labels = labels[:, None]
+    n, k = labels.shape
+    clusters, codes = np.unique(labels.ravel(), return_inverse=True)
+    # The raveled labels are row major, so entry i belongs to observation i // k.
+    order = np.argsort(codes, kind="stable")
+    indices = order // k
+    indptr = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(clusters)))]
+    return clusters, indptr, indices
+
+
+def cluster_bootstrap_means(values, indptr, indices, n_boot, rng, block_size=BLOCK_SIZE):
+    """
+    Resamples the clusters with replacement and returns the mean of the
+    observations of every resample, an observation counting once for every
+    draw of a cluster it belongs to. That mean only depends on how often
+    every cluster was drawn, so the sums and sizes of the clusters are
+    computed once and every batch of resamples is a bincount and two matrix
+    products.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    n_clusters = len(indptr) - 1
+    if n_clusters == 0:
+        return np.full(n_boot, np.nan)
+    sizes = np.diff(indptr).astype(float)
+    sums = np.bincount(
+        np.repeat(np.arange(n_clusters), np.diff(indptr)),
+        weights=values[indices],
+        minlength=n_clusters,
+    )
+    batch = max(1, block_size // n_clusters)
+
+    means = np.empty(n_boot)
+    done = 0
+    while done < n_boot:
+        b = min(batch, n_boot - done)
+        drawn = rng.integers(0, n_clusters, size=(b, n_clusters))
+        # How often each cluster was drawn, per resample. Offsetting every
+        # resample by n_clusters lets one bincount do all of them.
+        counts = np.bincount(
+            (drawn + n_clusters * np.arange(b)[:, None]).ravel(),
+            minlength=b * n_clusters,
+        ).reshape(b, n_clusters).astype(float)
+        means[done:done + b] = (counts @ sums) / (counts @ sizes)
+        done += b
+    return means
+
+
+def _mean_ci(values, n_boot, alpha, seed, block_size, labels=None):
+    rng = np.random.default_rng(seed)
+    if labels is None:
+        means = bootstrap_means(values, n_boot, rng, block_size)
+    else:
+        _, indptr, indices = cluster_index(labels)
+        means = cluster_bootstrap_means(values, indptr, indices, n_boot, rng, block_size)
+    return (
+        float(np.quantile(means, alpha / 2)),
+        float(np.quantile(means, 1 - alpha / 2)),
+    )
+
+
+def grouped_mean_ci(groups, n_boot=2000, alpha=0.05, seed=0, n_jobs=None,
+                    block_size=BLOCK_SIZE, clusters=None):
+    """
+    Percentile bootstrap confidence intervals of the mean of every group.
+
+    groups - list
+        The 1d samples, one per group.
+    n_jobs - int
+        Amount of processes, None uses all cores and 1 runs everything in
+        this process.
+    clusters - list
+        Optional, the labels of every group as taken by cluster_index(). If
+        given the clusters are resampled instead of the observations.
+
+    Returns a list with a (lower, upper) tuple per group, in order.
+    """
+    groups = [np.asarray(g, dtype=float).ravel() for g in groups]
+    seeds = np.random.SeedSequence(seed).spawn(len(groups))
+    if clusters is None:
+        clusters = [None] * len(groups)
+    args = [
+        (g, n_boot, alpha, s, block_size, c) for g, s, c in zip(groups, seeds, clusters)
+    ]
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, len(groups))
+    if n_jobs <= 1:
+        return [_mean_ci(*a) for a in args]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(_mean_ci, *zip(*args)))
@@ -0,0 +1,180 @@
+"""
+This file contains a successive halving search over model formulas. Instead of
+fitting every candidate formula on all training data, all candidates are
+fitted on a small random subsample, only the better half is kept and fitted on
+a subsample twice as large, and so on. Only the last few survivors are fitted
+on the full training data.
+
+With n candidates the total amount of fitted rows is about
+log2(n) * (full training size), instead of n * (full training size).
+
+The candidates of the model scripts are generated with spline_formulas():
+every combination of spline type and degrees of freedom of some columns,
+plus optional extra terms. search() holds the validation years out of the
+training data, runs the search and stores the score of every rung.
+"""
+
+import itertools
+import math
+import warnings
+import numpy as np
+import pandas as pd
+
+from shared.logit_cache import LogitCache
+from shared.metrics import evaluate
+
+# For these metrics lower is better, for the others higher is better.
+LOWER_IS_BETTER = {"log_loss", "brier_score_loss"}
+# The training years the candidates are scored on.
+VALID_YEARS = {2019, 2020, 2021}
+SPLINES = ("bs", "cr")
+
+
+def _score(cache, formula, valid_df, outcome, metric):
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = cache.fit(formula, disp=False)
+            p = model.predict(valid_df)
+        score = evaluate(valid_df[outcome].astype(int).values, p)[metric]
+    except Exception as e:
+        # Small subsamples can be perfectly separated, or not cover the range
+        # of a spline. Such a candidate simply drops out.
+        print(f"\t\tFailed to fit {formula}: {e}")
+        return math.nan
+    if metric not in LOWER_IS_BETTER:
+        score = -score
+    return score
+
+
+def successive_halving(train_df, valid_df, formulas, outcome, metric="log_loss",
+                       n_survivors=3, eta=2, seed=0):
+    """
+    train_df - DataFrame
+        Data the candidates are fitted on, subsamples are drawn from this.
+    valid_df - DataFrame
+        Data the candidates are scored on after every rung.
+    formulas - list
+        The candidate formulas.
+    outcome - str
+        The 0/1 column that is being predicted.
+    n_survivors - int
+        The amount of formulas that is fitted on the full training data.
+    eta - int
+        Only the best 1/eta of the candidates survives a rung.
+
+    Returns the surviving formulas, best first, and a DataFrame with the score
+    of every candidate at every rung.
+    """
+    n_full = len(train_df)
+    n_rungs = max(0, math.ceil(math.log(len(formulas) / n_survivors, eta)))
+    # One random order for all rungs, so every subsample contains the
+    # previous one.
+    order = np.random.default_rng(seed).permutation(n_full)
+
+    candidates = list(formulas)
+    history = []
+    for rung in range(n_rungs + 1):
+        n_rows = n_full if rung == n_rungs else max(1, n_full // eta ** (n_rungs - rung))
+        sub = train_df.iloc[np.sort(order[:n_rows])]
+        print(f"\tRung {rung}: {len(candidates)} formulas on {n_rows} rows…")
+        cache = LogitCache(sub)
+
+        scores = []
+        for formula in candidates:
+            score = _score(cache, formula, valid_df, outcome, metric)
+            scores.append(score)
+            history.append(
+                {
+                    "rung": rung,
+                    "n_rows": n_rows,
+                    "formula": formula,
+                    metric: score if metric in LOWER_IS_BETTER else -score,
+                }
+            )
+
+        # Failed fits (nan) drop out, otherwise they could survive a rung
+        # when many fits fail.
+        ranked = [candidates[i] for i in np.argsort(scores, kind="stable")
+                  if not math.isnan(scores[i])]
+        if rung < n_rungs:
+            keep = max(n_survivors, math.ceil(len(candidates) / eta))
+            candidates = ranked[:keep]
+        else:
+            candidates = ranked[:n_survivors]
+
+    if not candidates:
+        raise ValueError("None of the candidate formulas could be fitted.")
+    return candidates, pd.DataFrame(history)
+
+
+def search(train_df, years, formulas, outcome, out_fn, valid_years=VALID_YEARS, **kwargs):
+    """
+    Runs successive_halving() with the rows of valid_years as validation
+    data, so the test years stay unseen until the survivors are tested.
+
+    years - Series
+        The year of every row of train_df.
+    out_fn - str
+        Where the score of every candidate at every rung is stored.
+
+    Returns the surviving formulas, best first.
+    """
+    is_valid = years.isin(valid_years).to_numpy()
+    formulas, history = successive_halving(
+        train_df.loc[~is_valid], train_df.loc[is_valid], formulas, outcome, **kwargs
+    )
+    history["formula"] = history["formula"].str.replace(r"\s+", " ", regex=True).str.strip()
+    print(f"\tWriting the search history to {out_fn}")
+    history.to_csv(out_fn, index=False)
+    return formulas
+
+
+def spline_formulas(outcome, groups, bounds, dfs, base=(), options=(), splines=SPLINES):
+    """
+    outcome - str
+        The left hand side of the formulas.
+    groups - list
+        Lists of columns that get a spline each. The columns of a group share
+        their degrees of freedom, e.g. [["p1_age", "p2_age"], ["p1_ht",
+        "p2_ht"]] tries every df of the ages with every df of the heights.
+    bounds - dict
+        (min, max) per column. The search fits on small subsamples, which
+        would otherwise each get their own spline range.
+    dfs - iterable
+        The degrees of freedom to try.
+    base - list
+        Terms that are part of every formula, in front of the splines.
+    options - list
+        Lists of alternative terms, one of each list is added after the
+        splines. An empty string adds nothing.
+    splines - list
+        The spline types, all splines of a formula are of the same type.
+
+    Returns a formula per combination.
+    """
+    dfs = list(dfs)
+    formulas = []
+    for spline in splines:
+        for group_dfs in itertools.product(dfs, repeat=len(groups)):
+            terms = list(base)
+            for group, df in zip(groups, group_dfs):
+                for col in group:
+                    lo, hi = bounds[col]
+                    terms.append(f"{spline}({col}, df={df}, lower_bound={lo}, upper_bound={hi})")
+            for extra in itertools.product(*options):
+                formulas.append(f"{outcome} ~ " + " + ".join(terms + [t for t in extra if t]))
+    return formulas
+
+
+def pair_formulas(outcome, p1_col, p2_col, diff_col, lo, hi, dfs=range(3, 16)):
+    """
+    The candidates of the age and height models: a spline of both players'
+    values or of their difference diff_col, each without a year term, with
+    + year or with the difference times the year. lo and hi are the range of
+    the values, the difference can be at most that range either way.
+    """
+    bounds = {p1_col: (lo, hi), p2_col: (lo, hi), diff_col: (lo - hi, hi - lo)}
+    years = [["", "year", f"I({diff_col} * year)"]]
+    return (spline_formulas(outcome, [[p1_col, p2_col]], bounds, dfs, options=years)
+            + spline_formulas(outcome, [[diff_col]], bounds, dfs, options=years))
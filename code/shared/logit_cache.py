@@ -0,0 +1,108 @@
+"""
+This file contains a cache for fitting many logistic regression formulas on the
+same data, like the formula sweeps in the model.py files.
+
+Many of those formulas are nested, e.g. `win ~ da` inside `win ~ da + year`.
+A fit can start at the coefficients of the largest already fitted formula
+whose columns are a strict subset of its own, instead of at zero. statsmodels'
+Newton has no line search, so it can diverge from such a start, e.g. from
+formula 3 to formula 5 of test_model.py. The warm start is therefore first
+refined with the step halving Newton of logit.py. Only if that converges in
+fewer iterations than a fit from zero does statsmodels start at the result,
+which then takes a single iteration. Otherwise, or if the warm started fit
+fails anyway, the formula is simply fitted from zero.
+
+The fitted results are kept so likelihood-ratio tests between them need no
+refitting.
+"""
+
+import re
+import warnings
+import numpy as np
+import statsmodels.formula.api as smf
+from scipy.stats import chi2
+
+from shared.logit import MAX_ITER, fit_logit
+
+
+class LogitCache:
+    def __init__(self, data):
+        """
+        data - DataFrame
+            All formulas are fitted on this data, starting values are only
+            valid between fits on the same rows.
+        """
+        self.data = data
+        self.results = {}
+        # The iterations of the last fit from zero, a warm start has to beat
+        # that to be worth it.
+        self.cold_iterations = MAX_ITER
+
+    def fit(self, formula, **fit_kwargs):
+        """
+        Fits smf.logit(formula) on the data and returns the statsmodels result,
+        so predict(), llf, summary() and such all still work. Formulas that
+        were already fitted are returned from the cache.
+        """
+        # The formulas in get_formulas() are spread over multiple lines.
+        key = re.sub(r"\s+", " ", formula).strip()
+        if key in self.results:
+            return self.results[key]
+
+        model = smf.logit(formula, data=self.data)
+        result = None
+        start_params = self._start_params(model)
+        if start_params is not None:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    result = model.fit(start_params=start_params, **fit_kwargs)
+                if not result.mle_retvals["converged"]:
+                    result = None
+            except np.linalg.LinAlgError:
+                result = None
+        if result is None:
+            result = model.fit(**fit_kwargs)
+            self.cold_iterations = result.mle_retvals["iterations"]
+        self.results[key] = result
+        return result
+
+    def _start_params(self, model):
+        # The closest nested formula is the one with the most columns that
+        # are all part of the new formula. New columns start at 0.
+        exog_names = model.exog_names
+        best = None
+        for result in self.results.values():
+            if result.nobs != len(model.endog):
+                continue
+            params = result.params
+            if not set(params.index) < set(exog_names):
+                continue
+            if best is None or len(params) > len(best):
+                best = params
+        if best is None:
+            return None
+        start = best.reindex(exog_names).fillna(0).to_numpy()
+        # Refined with step halving, which can't diverge.
+        with np.errstate(over="ignore"):
+            warm = fit_logit(model.exog, model.endog, start, max_iter=self.cold_iterations - 1)
+        if not warm.converged or not np.all(np.isfinite(warm.params)):
+            return None
+        return warm.params
+
+    def lr_test(self, full_formula, reduced_formula, **fit_kwargs):
+        """
+        Likelihood-ratio test of the reduced formula against the full one.
+        Returns the LR statistic, the degrees of freedom and the p-value.
+        """
+        # Reduced first, so the full formula can start at its coefficients.
+        reduced = self.fit(reduced_formula, **fit_kwargs)
+        full = self.fit(full_formula, **fit_kwargs)
+        if full.nobs != reduced.nobs:
+            raise ValueError(
+                "Both models must be fitted on the same rows, check for NaN in "
+                "the extra columns of the full formula."
+            )
+        lr_stat = 2 * (full.llf - reduced.llf)
+        df_diff = int(full.df_model - reduced.df_model)
+        return lr_stat, df_diff, chi2.sf(lr_stat, df_diff)
@@ -0,0 +1,60 @@
+"""
+This file contains a compact integer key per match, to join the match level
+tables of the different analyses on instead of strings like
+df.index.astype(str) + "_" + str(year), which also depend on the order the
+files were read in.
+
+The key only depends on the match itself, so it is the same in every table
+and every run. The bits of the int64 are, from high to low:
+    - 1 bit for the tour (atp, wta).
+    - 2 bits for the tier (main, qual_chall, futures, amateur).
+    - 40 bits of a hash of the tourney_id.
+    - 20 bits for the match_num.
+That is 63 bits, so the keys are always positive. Two different tournaments
+of the same tour and tier could in theory get the same hash,
+match_keys() checks for that and raises a ValueError if it happens.
+"""
+
+import hashlib
+import numpy as np
+import pandas as pd
+
+TOURS = {"atp": 0, "wta": 1}
+TIERS = {"main": 0, "qual_chall": 1, "futures": 2, "amateur": 3}
+HASH_BITS = 40
+MATCH_NUM_BITS = 20
+
+
+def _tourney_hash(tourney_id):
+    digest = hashlib.blake2b(str(tourney_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> (64 - HASH_BITS)
+
+
+def match_keys(tourney_id, match_num, tour="atp", tier="main"):
+    """
+    tourney_id - array
+        The tourney_id of every match.
+    match_num - array
+        The match_num of every match.
+    tour - str
+        "atp" or "wta".
+    tier - str
+        "main", "qual_chall", "futures" or "amateur".
+
+    Returns an int64 array with the key of every match.
+    """
+    tourney_id = pd.Series(np.asarray(tourney_id, dtype=object)).astype(str)
+    match_num = np.asarray(match_num, dtype=np.int64)
+    if match_num.size and (match_num.min() < 0 or match_num.max() >= 1 << MATCH_NUM_BITS):
+        raise ValueError(f"match_num has to be within [0, {1 << MATCH_NUM_BITS}).")
+
+    # Every tournament has many matches, so every id is only hashed once.
+    codes, uniques = pd.factorize(tourney_id)
+    hashes = np.array([_tourney_hash(t) for t in uniques], dtype=np.int64)
+    if len(np.unique(hashes)) != len(hashes):
+        raise ValueError("Two tourney_ids have the same hash, the match keys are not unique.")
+
+    prefix = (TOURS[tour] << 2) | TIERS[tier]
+    return ((np.int64(prefix) << (HASH_BITS + MATCH_NUM_BITS))
+            | (hashes[codes] << MATCH_NUM_BITS)
+            | match_num)
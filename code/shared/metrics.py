@@ -0,0 +1,112 @@
+"""
+This file contains the evaluation metrics of the prediction models, computed
+together in one pass over (y, p) instead of with a separate sklearn call per
+metric, as well as bootstrapped confidence intervals for them.
+
+The bootstrap does not resample the rows one replicate at a time. Every
+replicate is turned into a vector of counts, how often each row was drawn,
+and all metrics are weighted sums over those counts. A batch of replicates is
+then a single matrix product.
+"""
+
+import numpy as np
+from scipy.stats import binom
+
+METRICS = ["accuracy_score", "log_loss", "brier_score_loss", "roc_auc_score"]
+# Amount of bootstrap replicates per batch, limits the memory use to roughly
+# BATCH_SIZE * len(y) * 8 bytes.
+BATCH_SIZE = 256
+
+
+def _prepare(y, p):
+    y = np.asarray(y, dtype=float).ravel()
+    p = np.asarray(p, dtype=float).ravel()
+    if len(y) != len(p):
+        raise ValueError(f"y has {len(y)} entries, but p has {len(p)}.")
+    # The same clipping as sklearn's log_loss.
+    eps = np.finfo(p.dtype).eps
+    p_clip = np.clip(p, eps, 1 - eps)
+    # Per row contributions, every metric but the AUC is their mean.
+    terms = {
+        "accuracy_score": ((p >= 0.5) == (y == 1)).astype(float),
+        "log_loss": -(y * np.log(p_clip) + (1 - y) * np.log(1 - p_clip)),
+        "brier_score_loss": (p - y) ** 2,
+    }
+
+    # The AUC only needs the order of p, so sort once. Tied predictions form
+    # a group, a positive counts half of the negatives it is tied with.
+    order = np.argsort(p, kind="mergesort")
+    p_sorted = p[order]
+    group_start = np.flatnonzero(np.r_[True, p_sorted[1:] != p_sorted[:-1]])
+    return y, terms, order, group_start
+
+
+def _auc(pos, neg, group_start):
+    """
+    pos and neg are the (weighted) amount of positives and negatives per row in
+    sorted order, either 1d or one row per bootstrap replicate.
+    """
+    pos_g = np.add.reduceat(pos, group_start, axis=-1)
+    neg_g = np.add.reduceat(neg, group_start, axis=-1)
+    # Negatives in all lower groups.
+    neg_below = np.cumsum(neg_g, axis=-1) - neg_g
+    n_pos = pos_g.sum(axis=-1)
+    n_neg = neg_g.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (pos_g * (neg_below + 0.5 * neg_g)).sum(axis=-1) / (n_pos * n_neg)
+
+
+def evaluate(y, p):
+    """
+    Returns a dict with accuracy_score, log_loss, brier_score_loss and
+    roc_auc_score of the predicted probabilities p for the 0/1 results y, as
+    well as pval_acc_gt_50, the one sided binomial test p-value of the
+    accuracy against guessing. The values match the sklearn functions.
+    """
+    y, terms, order, group_start = _prepare(y, p)
+    n = len(y)
+    out = {metric: float(values.mean()) for metric, values in terms.items()}
+    y_sorted = y[order]
+    out["roc_auc_score"] = float(_auc(y_sorted, 1 - y_sorted, group_start))
+    # Same as binomtest(k, n, p=0.5, alternative="greater").pvalue.
+    k = int(terms["accuracy_score"].sum())
+    out["pval_acc_gt_50"] = float(binom.sf(k - 1, n, 0.5))
+    return out
+
+
+def bootstrap_ci(y, p, n_boot=1000, alpha=0.05, seed=0, batch_size=BATCH_SIZE):
+    """
+    Percentile bootstrap confidence intervals of the metrics of evaluate().
+    Returns a dict with {metric}_ci_lower and {metric}_ci_upper per metric.
+    The same seed always gives the same intervals.
+    """
+    y, terms, order, group_start = _prepare(y, p)
+    n = len(y)
+    rng = np.random.default_rng(seed)
+    # Sorted like the AUC needs, the other metrics don't care about order.
+    term_matrix = np.column_stack([terms[m][order] for m in METRICS[:-1]])
+    y_sorted = y[order]
+
+    boots = np.empty((n_boot, len(METRICS)))
+    done = 0
+    while done < n_boot:
+        b = min(batch_size, n_boot - done)
+        # Drawing positions in the sorted order is the same as drawing rows.
+        idx = rng.integers(0, n, size=(b, n))
+        # How often each row was drawn, per replicate. Offsetting every
+        # replicate by n lets one bincount do all of them.
+        counts = np.bincount(
+            (idx + n * np.arange(b)[:, None]).ravel(), minlength=b * n
+        ).reshape(b, n).astype(float)
+
+        boots[done:done + b, :-1] = counts @ term_matrix / n
+        boots[done:done + b, -1] = _auc(counts * y_sorted, counts * (1 - y_sorted), group_start)
+        done += b
+
+    lower = np.nanquantile(boots, alpha / 2, axis=0)
+    upper = np.nanquantile(boots, 1 - alpha / 2, axis=0)
+    out = {}
+    for i, metric in enumerate(METRICS):
+        out[f"{metric}_ci_lower"] = float(lower[i])
+        out[f"{metric}_ci_upper"] = float(upper[i])
+    return out
@@ -0,0 +1,220 @@
+"""
+This file contains a search index over the names of atp_players.csv and
+wta_players.csv, to go from a name to the player ids without grepping the
+csv files, e.g.
+
+    index = NameIndex.from_csvs()
+    index.search("barros fil")
+    index.search("Cilic", tour="atp")
+    index.search("federrer")
+
+The names are normalized first: accents are removed, so "Cilic" finds
+"Čilić", everything is lower case and anything that is not a letter or a digit
+is a space. A query is then tried as
+
+- exact: the normalized name equals the query, as "first last" or
+  "last first".
+- prefix: the name starts with the query, also in both orders. The keys are
+  sorted once, so all names with a prefix are a single range found with two
+  bisects.
+- fuzzy: the names sharing the most trigrams (groups of three letters) with
+  the query, scored by the Dice coefficient 2 * shared / (n query + n name).
+  Both the full name and the last name are indexed and a player gets the
+  best of the two scores, otherwise a misspelled last name alone scores
+  higher against short full names than against the right one. Every trigram
+  has the list of names it occurs in (an inverted index), so only the lists
+  of the trigrams of the query are read, and the shared trigrams of the
+  names in those are counted by sorting them, without an array over all
+  names.
+
+A search takes a few tenths of a millisecond for exact and prefix matches and
+about 1.5 milliseconds for a fuzzy one, up to 3 for short common names like
+"maria". Building the index takes a few seconds.
+"""
+
+import bisect
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+
+PLAYERS_CSVS = {
+    "atp": "../../data/tennis_atp_data/unaltered_data/atp_players.csv",
+    "wta": "../../data/tennis_wta_data/unaltered_data/wta_players.csv",
+}
+# Fuzzy matches with a lower Dice coefficient are not returned.
+MIN_SCORE = 0.3
+LIMIT = 10
+
+
+def normalize(name):
+    """
+    Lower case, without accents and with only letters, digits and single
+    spaces, e.g. "Hélcio Barros-Filho" -> "helcio barros filho".
+    """
+    if not isinstance(name, str):
+        return ""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", name.lower()).split())
+
+
+def trigrams(name):
+    """
+    The distinct trigrams of a normalized name, padded with spaces so the
+    start and end of the name count as well.
+    """
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """
+    tours, ids and names hold the players in the order of the csv files, the
+    other arrays refer to them by position.
+    """
+
+    def __init__(self, players):
+        """
+        players - DataFrame
+            With a tour, player_id, name_first and name_last column.
+        """
+        first = players["name_first"].fillna("").astype(str)
+        last = players["name_last"].fillna("").astype(str)
+        self.tours = players["tour"].to_numpy()
+        self.ids = players["player_id"].to_numpy(dtype=np.int64)
+        self.names = (first + " " + last).str.strip().to_numpy()
+
+        norm_first = [normalize(n) for n in first]
+        norm_last = [normalize(n) for n in last]
+
+        # Every player is in the sorted keys twice, as "first last" and as
+        # "last first", so a prefix of either name is found.
+        keys = []
+        for i, (f, la) in enumerate(zip(norm_first, norm_last)):
+            keys.append((f"{f} {la}".strip(), i))
+            keys.append((f"{la} {f}".strip(), i))
+        keys.sort()
+        self.keys = [k for k, _ in keys]
+        self.key_players = np.array([i for _, i in keys], dtype=np.int64)
+
+        # The indexed names are the full names, then the last names, so name
+        # j belongs to player j % len(ids). The inverted index as CSR arrays:
+        # the names with trigram code t are postings[indptr[t]:indptr[t + 1]].
+        full = [f"{f} {la}".strip() for f, la in zip(norm_first, norm_last)]
+        self.trigram_codes = {}
+        codes, names_of = [], []
+        self.n_trigrams = np.zeros(2 * len(self.ids), dtype=np.int64)
+        for j, name in enumerate(full + norm_last):
+            grams = trigrams(name) if name else set()
+            self.n_trigrams[j] = len(grams)
+            for g in grams:
+                codes.append(self.trigram_codes.setdefault(g, len(self.trigram_codes)))
+                names_of.append(j)
+        codes = np.array(codes, dtype=np.int64)
+        order = np.argsort(codes, kind="stable")
+        self.postings = np.array(names_of, dtype=np.int64)[order]
+        self.indptr = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(self.trigram_codes)))]
+
+    @classmethod
+    def from_csvs(cls, paths=PLAYERS_CSVS):
+        """
+        paths - dict
+            The players csv per tour, e.g. only {"atp": ...} for one tour.
+        """
+        dfs = []
+        for tour, path in paths.items():
+            df = pd.read_csv(path, usecols=["player_id", "name_first", "name_last"],
+                             dtype={"name_first": str, "name_last": str})
+            df["tour"] = tour
+            dfs.append(df)
+        return cls(pd.concat(dfs, ignore_index=True))
+
+    def _result(self, players, scores, match, tour, limit):
+        players = np.asarray(players, dtype=np.int64)
+        if tour is not None:
+            keep = self.tours[players] == tour
+            players, scores, match = players[keep], scores[keep], match[keep]
+        players, scores, match = players[:limit], scores[:limit], match[:limit]
+        return pd.DataFrame({
+            "tour": self.tours[players],
+            "player_id": self.ids[players],
+            "name": self.names[players],
+            "match": match,
+            "score": scores,
+        })
+
+    def prefix(self, query, tour=None, limit=LIMIT):
+        """
+        The players with a name (first last or last first) starting with
+        query, exact matches first, then in alphabetical order.
+        """
+        query = normalize(query)
+        lo = bisect.bisect_left(self.keys, query)
+        # The keys equal to query come first in the range of the prefix.
+        exact_hi = bisect.bisect_right(self.keys, query, lo)
+        hi = bisect.bisect_left(self.keys, query + "\x7f", exact_hi) if query else lo
+        players = pd.unique(self.key_players[lo:hi])
+        n_exact = len(pd.unique(self.key_players[lo:exact_hi]))
+        match = np.where(np.arange(len(players)) < n_exact, "exact", "prefix")
+        return self._result(players, np.ones(len(players)), match, tour, limit)
+
+    def fuzzy(self, query, tour=None, limit=LIMIT, min_score=MIN_SCORE):
+        """
+        The players whose full or last name shares the most trigrams with
+        query, by the best Dice coefficient of the two, leaving out those
+        below min_score.
+        """
+        query = normalize(query)
+        grams = trigrams(query) if query else set()
+        codes = [self.trigram_codes[g] for g in grams if g in self.trigram_codes]
+        hits = np.concatenate([self.postings[self.indptr[c]:self.indptr[c + 1]]
+                               for c in codes] + [np.zeros(0, dtype=np.int64)])
+        # The shared trigrams are only counted for the names in hits, which
+        # are far fewer than all names: after sorting, every name is a run
+        # and its count is the length of that run.
+        hits = np.sort(hits)
+        starts = np.flatnonzero(np.r_[True, hits[1:] != hits[:-1]]) if len(hits) else hits
+        names = hits[starts]
+        shared = np.diff(np.r_[starts, len(hits)])
+        name_scores = 2 * shared / (len(grams) + self.n_trigrams[names])
+        keep = name_scores >= min_score
+        names, name_scores = names[keep], name_scores[keep]
+        # The best score of the full and the last name of every player.
+        players, inverse = np.unique(names % len(self.ids), return_inverse=True)
+        scores = np.zeros(len(players))
+        np.maximum.at(scores, inverse, name_scores)
+        if tour is not None:
+            keep = self.tours[players] == tour
+            players, scores = players[keep], scores[keep]
+        # Only the best limit players are sorted.
+        if len(players) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            players, scores = players[top], scores[top]
+        order = np.lexsort((players, -scores))
+        match = np.full(len(order), "fuzzy")
+        return self._result(players[order], scores[order], match, None, limit)
+
+    def search(self, query, tour=None, limit=LIMIT):
+        """
+        query - str
+            A (part of a) name, in any case and with or without accents.
+        tour - str
+            "atp" or "wta" to only search that tour, None for both.
+
+        Returns a DataFrame with the tour, player_id, name, match ("exact",
+        "prefix" or "fuzzy") and score of at most limit players. The fuzzy
+        search is only done if there are no exact or prefix matches.
+        """
+        out = self.prefix(query, tour, limit)
+        if len(out):
+            return out
+        return self.fuzzy(query, tour, limit)
+
+    def ids_of(self, name, tour=None):
+        """
+        The player ids of the players with exactly this (normalized) name,
+        e.g. to go from a name to the id of a player in the match files.
+        """
+        out = self.prefix(name, tour, limit=len(self.ids))
+        return out.loc[out["match"] == "exact", "player_id"].tolist()
@@ -0,0 +1,103 @@
+"""
+This file contains a player dimension table, the hand, date of birth, height
+and country of every player of atp_players.csv. Instead of carrying those on
+every match row, e.g. winner_hand, winner_ht and winner_age, the matches only
+need the player ids and the attributes are looked up when needed.
+
+The player ids are consecutive numbers (100001 to about 210000), so every
+attribute is a dense array with the value of player id i at position
+i - first id. A lookup for any number of ids is then a single array gather,
+no merge. The hand is normalized once here instead of once per match, and
+the age is computed exactly from the date of birth and the date of the
+match.
+"""
+
+import numpy as np
+import pandas as pd
+
+from shared.rankings import to_days
+
+PLAYERS_CSV = "../../data/tennis_atp_data/unaltered_data/atp_players.csv"
+HANDS = ["R", "L", "U", "A"]
+DAYS_PER_YEAR = 365.25
+
+
+class PlayerIndex:
+    """
+    dob (days since 1970), height, hand (code in HANDS) and ioc (code in
+    iocs) per player id, -1 or NaN if unknown.
+    """
+
+    def __init__(self, players):
+        ids = players["player_id"].to_numpy(dtype=np.int64)
+        self.first_id = int(ids.min())
+        pos = ids - self.first_id
+        size = int(pos.max()) + 1
+
+        self.dob = np.full(size, np.nan)
+        self.dob[pos] = to_days(players["dob"])
+        self.height = np.full(size, np.nan)
+        self.height[pos] = pd.to_numeric(players["height"], errors="coerce").to_numpy()
+
+        hand = players["hand"].astype("string").str.strip().str.upper()
+        self.hand = np.full(size, -1, dtype=np.int8)
+        self.hand[pos] = pd.Categorical(hand, categories=HANDS).codes
+
+        ioc_codes, self.iocs = pd.factorize(players["ioc"])
+        self.ioc = np.full(size, -1, dtype=np.int32)
+        self.ioc[pos] = ioc_codes
+
+    @classmethod
+    def from_csv(cls, path=PLAYERS_CSV):
+        return cls(pd.read_csv(path, usecols=["player_id", "hand", "dob", "ioc", "height"]))
+
+    def _positions(self, player_ids):
+        """
+        The position of every id in the arrays, -1 for unknown or missing ids.
+        """
+        ids = np.asarray(player_ids)
+        if ids.dtype.kind in "iu":
+            # Integer ids can't be missing, which skips the conversion.
+            pos = ids.astype(np.int64) - self.first_id
+            known = (pos >= 0) & (pos < len(self.dob))
+            return np.where(known, pos, -1)
+        ids = pd.to_numeric(pd.Series(player_ids), errors="coerce").to_numpy(dtype=float)
+        pos = np.nan_to_num(ids, nan=-1).astype(np.int64) - self.first_id
+        known = ~np.isnan(ids) & (pos >= 0) & (pos < len(self.dob))
+        return np.where(known, pos, -1)
+
+    def _gather(self, values, pos, missing):
+        return np.where(pos >= 0, values[np.maximum(pos, 0)], missing)
+
+    def heights(self, player_ids):
+        return self._gather(self.height, self._positions(player_ids), np.nan)
+
+    def hands(self, player_ids):
+        """
+        The hands as a categorical with the levels HANDS, NaN if unknown.
+        """
+        codes = self._gather(self.hand, self._positions(player_ids), -1)
+        return pd.Categorical.from_codes(codes, categories=HANDS)
+
+    def iocs_of(self, player_ids):
+        codes = self._gather(self.ioc, self._positions(player_ids), -1)
+        return pd.Categorical.from_codes(codes, categories=self.iocs)
+
+    def ages(self, player_ids, dates):
+        """
+        The exact age in years at dates, yyyymmdd integers like tourney_date.
+        """
+        dob = self._gather(self.dob, self._positions(player_ids), np.nan)
+        return (to_days(dates) - dob) / DAYS_PER_YEAR
+
+    def attributes(self, player_ids, dates, prefix):
+        """
+        A DataFrame with {prefix}_hand, {prefix}_ht, {prefix}_age and
+        {prefix}_ioc, the same names as the columns of the match files.
+        """
+        return pd.DataFrame({
+            f"{prefix}_hand": self.hands(player_ids),
+            f"{prefix}_ht": self.heights(player_ids),
+            f"{prefix}_age": self.ages(player_ids, dates),
+            f"{prefix}_ioc": self.iocs_of(player_ids),
+        })
@@ -0,0 +1,154 @@
+"""
+This file contains a store of the weekly ATP rankings (atp_rankings_*.csv)
+and an as-of join of those rankings onto matches. The match files only have
+the ranking of the players at the time of the tournament, and those are
+missing for the early years and often for the lower tiers.
+
+The rankings are sorted by player and then date, so the rankings of a player
+are a contiguous block and within it the dates are increasing. Every player
+gets a code, and code * SPAN + day is then a single increasing key for all
+rankings. The latest ranking of any number of (player, date) pairs is found
+with one searchsorted on that key, no loops and no merges, which takes well
+under a second for millions of matches.
+"""
+
+import glob
+import numpy as np
+import pandas as pd
+
+RANKINGS_GLOB = "../../data/tennis_atp_data/unaltered_data/atp_rankings_*.csv"
+# Larger than the amount of days between any two dates, so the keys of
+# different players never overlap.
+SPAN = 1 << 20
+# Rankings older than this at the date of the match are not used, e.g. when
+# the rankings of some years are missing.
+MAX_AGE_WEEKS = 8
+TRAJECTORY_WEEKS = (4, 12, 52)
+
+
+def to_days(dates):
+    """
+    yyyymmdd integers (or datetimes) to days since 1970, as floats so a
+    missing date can be NaN.
+    """
+    if isinstance(dates, np.ndarray) and dates.dtype.kind in "iu":
+        # Integer dates can't be missing, which skips the conversion.
+        ymd = dates.astype(np.int64)
+        missing = np.zeros(len(ymd), dtype=bool)
+        return _ymd_to_days(ymd, missing)
+    dates = pd.Series(dates)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        days = dates.to_numpy(dtype="datetime64[D]").astype(np.int64).astype(float)
+        days[dates.isna().to_numpy()] = np.nan
+        return days
+    # Computed from the digits instead of parsing strings, which is many
+    # times faster for millions of dates.
+    ymd = pd.to_numeric(dates, errors="coerce").to_numpy(dtype=float)
+    missing = np.isnan(ymd)
+    ymd = np.where(missing, 19700101, ymd).astype(np.int64)
+    return _ymd_to_days(ymd, missing)
+
+
+def _ymd_to_days(ymd, missing):
+    # e.g. a date of birth with an unknown day, 19870100.
+    missing |= ~((ymd // 100 % 100 >= 1) & (ymd // 100 % 100 <= 12)
+                 & (ymd % 100 >= 1) & (ymd % 100 <= 31))
+    ymd = np.where(missing, 19700101, ymd)
+    months = (ymd // 10000 - 1970) * 12 + (ymd // 100 % 100 - 1)
+    days = (months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+            + ymd % 100 - 1).astype(float)
+    days[missing] = np.nan
+    return days
+
+
+class RankingStore:
+    """
+    players holds the sorted player ids, the rankings of players[i] are at
+    positions indptr[i] to indptr[i + 1] of days, rank and points.
+    """
+
+    def __init__(self, player, ranking_date, rank, points):
+        player = np.asarray(player, dtype=np.int64)
+        days = to_days(ranking_date)
+        if np.isnan(days).any():
+            raise ValueError("Every ranking needs a valid ranking_date.")
+        order = np.lexsort((days, player))
+        player = player[order]
+        self.days = days[order]
+        self.rank = np.asarray(rank, dtype=float)[order]
+        self.points = np.asarray(points, dtype=float)[order]
+        self.players, codes = np.unique(player, return_inverse=True)
+        self.indptr = np.r_[0, np.cumsum(np.bincount(codes))]
+        self.keys = codes * SPAN + (self.days - self.days.min())
+        self.first_day = self.days.min()
+
+    @classmethod
+    def from_files(cls, pattern=RANKINGS_GLOB):
+        dfs = [pd.read_csv(fn) for fn in sorted(glob.glob(pattern))]
+        if not dfs:
+            raise ValueError(f"No rankings files match {pattern}.")
+        df = pd.concat(dfs, ignore_index=True).drop_duplicates(["player", "ranking_date"])
+        return cls(df["player"], df["ranking_date"], df["rank"], df["points"])
+
+    def _lookup(self, codes, days, max_age_days):
+        """
+        The position of the latest ranking on or before days for the players
+        with codes, -1 where there is none.
+        """
+        known = (codes >= 0) & ~np.isnan(days)
+        known[known] &= days[known] >= self.first_day
+        query = np.where(known, codes * SPAN + (np.nan_to_num(days) - self.first_day), 0)
+        pos = np.searchsorted(self.keys, query, side="right") - 1
+        safe_codes = np.where(known, codes, 0)
+        # The found ranking has to be of the same player and recent enough.
+        ok = known & (pos >= self.indptr[safe_codes])
+        ok[ok] &= days[ok] - self.days[pos[ok]] <= max_age_days
+        return np.where(ok, pos, -1)
+
+    def asof(self, player_ids, dates, max_age_weeks=MAX_AGE_WEEKS, weeks_back=0):
+        """
+        player_ids - array
+        dates - array
+            yyyymmdd integers like tourney_date, or datetimes.
+        weeks_back - int
+            Looks up the ranking of that many weeks before the dates instead.
+
+        Returns the rank and points of the latest ranking on or before every
+        date, NaN if there is none within max_age_weeks.
+        """
+        return self._asof(self._codes(player_ids), to_days(dates) - 7 * weeks_back,
+                          max_age_weeks)
+
+    def _codes(self, player_ids):
+        player_ids = np.asarray(player_ids, dtype=float)
+        idx = np.searchsorted(self.players, np.nan_to_num(player_ids, nan=-1).astype(np.int64))
+        idx = np.minimum(idx, len(self.players) - 1)
+        return np.where(self.players[idx] == player_ids, idx, -1)
+
+    def _asof(self, codes, days, max_age_weeks):
+        pos = self._lookup(codes, days, 7 * max_age_weeks)
+        found = pos >= 0
+        rank = np.where(found, self.rank[np.maximum(pos, 0)], np.nan)
+        points = np.where(found, self.points[np.maximum(pos, 0)], np.nan)
+        return rank, points
+
+    def join(self, df, id_col, date_col, prefix, trajectory=TRAJECTORY_WEEKS,
+             max_age_weeks=MAX_AGE_WEEKS):
+        """
+        Returns a copy of df with {prefix}_asof_rank and {prefix}_asof_points,
+        the ranking of the player in id_col as of date_col, and per number of
+        weeks k in trajectory {prefix}_rank_change_{k}w, the rank now minus
+        the rank k weeks earlier. So a negative change means the player
+        climbed.
+        """
+        out = df.copy()
+        # The players and dates are only converted once for all lookups.
+        codes = self._codes(df[id_col])
+        days = to_days(df[date_col])
+        rank, points = self._asof(codes, days, max_age_weeks)
+        out[f"{prefix}_asof_rank"] = rank
+        out[f"{prefix}_asof_points"] = points
+        for k in trajectory:
+            before, _ = self._asof(codes, days - 7 * k, max_age_weeks)
+            out[f"{prefix}_rank_change_{k}w"] = rank - before
+        return out
@@ -0,0 +1,95 @@
+"""
+This file contains a histogram of a 0/1 outcome, e.g. won or lost, against an
+integer valued feature like a win streak, optionally split by a second
+grouping like skill bin or surface. Per key (and group) it gives the amount of
+observations and successes, the rate, a smoothed rate and a Wilson confidence
+interval.
+
+All counting is done with a single bincount over the combined (key, group)
+index, instead of looping over the rows.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+def wilson_ci(successes, n, alpha=0.05):
+    """
+    The Wilson score interval of a binomial proportion, which unlike the
+    normal approximation stays within [0, 1] and behaves for small n and
+    rates close to 0 or 1. Returns the lower and upper bounds, nan if n is 0.
+    """
+    successes = np.asarray(successes, dtype=float)
+    n = np.asarray(n, dtype=float)
+    z = norm.ppf(1 - alpha / 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = successes / n
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return center - half, center + half
+
+
+def conditional_rates(keys, outcomes, groups=None, smoothing=1.0, prior=None, alpha=0.05,
+                      min_key=None, max_key=None):
+    """
+    keys - array
+        The integer feature of every observation, e.g. the win streak.
+    outcomes - array
+        0/1 of every observation, e.g. won.
+    groups - array
+        Optional second grouping of every observation, e.g. the skill bin.
+    smoothing - float
+        Pseudo count of the smoothed rate, (successes + smoothing * prior) /
+        (n + smoothing). Keys with few observations are pulled to the prior.
+    prior - float
+        The rate the smoothed rate is pulled to, the overall rate by default.
+    min_key, max_key - int
+        The range of keys in the result, the observed range by default. Keys
+        without observations get n = 0 and nan rates.
+
+    Returns a DataFrame with one row per key (per group) with the columns
+    key, (group,) n, successes, rate, smoothed_rate, ci_lower and ci_upper.
+    """
+    keys = np.asarray(keys)
+    outcomes = np.asarray(outcomes, dtype=float)
+    valid = ~pd.isna(keys) & ~np.isnan(outcomes)
+    if groups is not None:
+        groups = np.asarray(groups)
+        valid &= ~pd.isna(groups)
+        group_levels, group_codes = np.unique(groups[valid], return_inverse=True)
+    else:
+        group_levels, group_codes = np.array([None]), np.zeros(valid.sum(), dtype=int)
+    keys = keys[valid].astype(np.int64)
+    outcomes = outcomes[valid]
+
+    lo = int(keys.min()) if min_key is None else min_key
+    hi = int(keys.max()) if max_key is None else max_key
+    in_range = (keys >= lo) & (keys <= hi)
+    n_keys = hi - lo + 1
+    n_groups = len(group_levels)
+    # One index per (group, key) pair.
+    index = group_codes[in_range] * n_keys + (keys[in_range] - lo)
+    n = np.bincount(index, minlength=n_groups * n_keys)
+    successes = np.bincount(index, weights=outcomes[in_range], minlength=n_groups * n_keys)
+
+    if prior is None:
+        prior = outcomes.mean() if len(outcomes) else 0.5
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = successes / n
+    ci_lower, ci_upper = wilson_ci(successes, n, alpha)
+
+    out = pd.DataFrame(
+        {
+            "key": np.tile(np.arange(lo, hi + 1), n_groups),
+            "n": n,
+            "successes": successes.astype(np.int64),
+            "rate": rate,
+            "smoothed_rate": (successes + smoothing * prior) / (n + smoothing),
+            "ci_lower": ci_lower,
+            "ci_upper": ci_upper,
+        }
+    )
+    if groups is not None:
+        out.insert(1, "group", np.repeat(group_levels, n_keys))
+    return out
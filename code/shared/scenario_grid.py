@@ -0,0 +1,138 @@
+"""
+This file contains what-if grids of a fitted formula model: the predictions
+for every combination of a few variables, e.g. height x age x surface x rank
+gap, with the other variables held fixed.
+
+model.predict() on a meshgrid builds the whole design matrix through patsy,
+one row per grid point. But the linear predictor is a sum over the terms of
+the formula, and most terms only depend on one or two of the grid variables,
+e.g. bs(p1_age, df=6) only on p1_age. So every term is evaluated only on the
+grid of its own variables, one small matrix-vector product each, and the
+results are broadcast and added together over the full grid. Those per term
+contributions are cached, so a report with hundreds of heatmaps that share
+their axes only builds every basis once.
+
+    grid = ScenarioGrid(model)
+    p = grid.evaluate({"p1_ht": heights, "p2_ht": heights},
+                      fixed={"p1_age": 25, "p2_age": 25, "surface": "Clay"})
+"""
+
+import ast
+import numpy as np
+import pandas as pd
+from patsy import build_design_matrices
+
+# Grid points per matrix-vector product, for terms with many grid variables.
+CHUNK_SIZE = 100_000
+
+
+def _names(code):
+    """
+    The names used in the code of a patsy factor, e.g. bs, p1_age and df for
+    "bs(p1_age, df=6)".
+    """
+    return {node.id for node in ast.walk(ast.parse(code.strip(), mode="eval"))
+            if isinstance(node, ast.Name)}
+
+
+class ScenarioGrid:
+    """
+    A fitted statsmodels formula model, e.g. of smf.logit(...).fit(), split
+    into its terms.
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.design_info = result.model.data.design_info
+        self.params = np.asarray(result.params, dtype=float)
+        columns = set(result.model.data.frame.columns)
+        # The data columns every term depends on.
+        self.term_vars = {}
+        for term in self.design_info.terms:
+            names = set()
+            for factor in term.factors:
+                names |= _names(factor.name())
+            self.term_vars[term] = sorted(names & columns)
+        self.cache = {}
+
+    def _link(self, eta):
+        # The inverse link of the model, e.g. the logistic function of Logit.
+        cdf = getattr(self.result.model, "cdf", None)
+        return eta if cdf is None else cdf(eta)
+
+    def _term(self, term, axes, fixed):
+        """
+        The contribution of term to the linear predictor, on the grid of only
+        the axes it depends on, in the order of axes.
+        """
+        dims = [d for d in axes if d in self.term_vars[term]]
+        consts = {v: fixed[v] for v in self.term_vars[term] if v not in axes}
+        key = (term, tuple((d, tuple(np.asarray(axes[d]).tolist())) for d in dims),
+               tuple(sorted(consts.items())))
+        if key in self.cache:
+            return dims, self.cache[key]
+
+        beta = self.params[self.design_info.term_slices[term]]
+        shape = [len(axes[d]) for d in dims]
+        if not dims and not consts:
+            # e.g. the intercept, a constant.
+            values = build_design_matrices([self.design_info.subset([term])],
+                                           pd.DataFrame(index=[0]),
+                                           return_type="matrix")[0] @ beta
+            out = np.full(shape, values[0])
+        else:
+            mesh = np.meshgrid(*[np.asarray(axes[d]) for d in dims], indexing="ij")
+            flat = {d: m.ravel() for d, m in zip(dims, mesh)}
+            n = int(np.prod(shape))
+            sub = self.design_info.subset([term])
+            out = np.empty(n)
+            for start in range(0, n, CHUNK_SIZE):
+                end = min(start + CHUNK_SIZE, n)
+                data = pd.DataFrame({d: v[start:end] for d, v in flat.items()},
+                                    index=range(end - start))
+                for v, value in consts.items():
+                    data[v] = value
+                X = build_design_matrices([sub], data, return_type="matrix")[0]
+                out[start:end] = np.asarray(X) @ beta
+            out = out.reshape(shape)
+        self.cache[key] = out
+        return dims, out
+
+    def evaluate(self, axes, fixed=None, linear=False):
+        """
+        axes - dict
+            The values of every grid variable, e.g. {"p1_ht": range(160, 211)}.
+            The result has an axis per entry, in this order.
+        fixed - dict
+            The value of every other variable the formula uses.
+        linear - bool
+            Returns the linear predictor instead of the prediction, e.g. the
+            log odds instead of the probability of a logit model.
+
+        Returns an array with the predictions on the grid.
+        """
+        fixed = dict(fixed or {})
+        axes = {d: np.asarray(v) for d, v in axes.items()}
+        needed = set().union(*self.term_vars.values())
+        missing = needed - set(axes) - set(fixed)
+        if missing:
+            raise ValueError(f"The model needs values for {sorted(missing)}, add them to "
+                             "axes or fixed.")
+        order = list(axes)
+        eta = np.zeros([len(axes[d]) for d in order])
+        for term in self.design_info.terms:
+            dims, values = self._term(term, axes, fixed)
+            # Size 1 axes for the grid variables the term does not use.
+            shape = [len(axes[d]) if d in dims else 1 for d in order]
+            eta += values.reshape(shape)
+        return eta if linear else self._link(eta)
+
+    def to_frame(self, axes, fixed=None, col="p"):
+        """
+        evaluate() as a DataFrame with a row per grid point, a column per
+        axis and the prediction in col.
+        """
+        p = self.evaluate(axes, fixed)
+        index = pd.MultiIndex.from_product([np.asarray(v) for v in axes.values()],
+                                           names=list(axes))
+        return pd.DataFrame({col: p.ravel()}, index=index).reset_index()
@@ -0,0 +1,90 @@
+"""
+This file contains a separate logistic regression per stratum, e.g. per skill
+bin or per skill bin x surface x tier. The data is grouped once: sorted by
+stratum, so every stratum is a contiguous block of the design matrix that is
+sliced instead of filtered with a mask. The strata are then fitted in
+parallel with fit_logit() and the coefficients are returned as a single
+table, one row per stratum and term.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import norm
+
+from shared.logit import fit_logit
+
+
+def _fit(X, y):
+    return fit_logit(X, y)
+
+
+def fit_strata(df, y_col, x_cols, strata, min_rows=10, n_jobs=None):
+    """
+    df - DataFrame
+    y_col - str
+        The 0/1 column that is being predicted.
+    x_cols - list
+        The predictors, an intercept is added.
+    strata - list
+        The columns that together define a stratum.
+    min_rows - int
+        Strata with fewer rows are skipped.
+    n_jobs - int
+        Amount of processes, None uses all cores and 1 fits everything in this
+        process.
+
+    Returns a dict from stratum to its LogitFit, where a stratum is a value
+    with one stratum column and a tuple otherwise, and a DataFrame with the
+    strata columns, term, coef, std_err, z, p_value, n and converged.
+    """
+    df = df.dropna(subset=[y_col, *x_cols, *strata])
+    codes = df.groupby(strata, sort=True, observed=True).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    X = np.column_stack([np.ones(len(df))] + [df[c].to_numpy(dtype=float) for c in x_cols])
+    X = X[order]
+    y = df[y_col].to_numpy(dtype=float)[order]
+    first = df[strata].iloc[order]
+
+    sizes = np.bincount(codes)
+    indptr = np.r_[0, np.cumsum(sizes)]
+    blocks = [(lo, hi) for lo, hi in zip(indptr[:-1], indptr[1:]) if hi - lo >= min_rows]
+    keys = []
+    for lo, _ in blocks:
+        values = tuple(first.iloc[lo])
+        keys.append(values[0] if len(strata) == 1 else values)
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, len(blocks))
+    Xs = [X[lo:hi] for lo, hi in blocks]
+    ys = [y[lo:hi] for lo, hi in blocks]
+    if n_jobs <= 1:
+        fits = [_fit(X_s, y_s) for X_s, y_s in zip(Xs, ys)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            fits = list(pool.map(_fit, Xs, ys))
+
+    terms = ["const", *x_cols]
+    rows = []
+    for key, (lo, hi), fit in zip(keys, blocks, fits):
+        # The inverse of the Hessian of the negative log-likelihood is the
+        # covariance of the coefficients.
+        std_err = np.sqrt(np.abs(np.diag(np.linalg.pinv(fit.hessian))))
+        z = fit.params / std_err
+        for i, term in enumerate(terms):
+            row = dict(zip(strata, key if len(strata) > 1 else (key,)))
+            row.update(
+                {
+                    "term": term,
+                    "coef": fit.params[i],
+                    "std_err": std_err[i],
+                    "z": z[i],
+                    "p_value": 2 * norm.sf(abs(z[i])),
+                    "n": hi - lo,
+                    "converged": fit.converged,
+                }
+            )
+            rows.append(row)
+    return dict(zip(keys, fits)), pd.DataFrame(rows)
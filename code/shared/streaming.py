@@ -0,0 +1,126 @@
+"""
+This file contains a streaming version of the per group player statistics of
+the tier analyses. Instead of loading all matches, stacking the winners and
+losers and dropping the duplicate players, the matches are read chunk by
+chunk:
+    - Which players were already counted per group is kept in a bitset, one
+      bit per player id, so a group with thousands of players takes a few
+      kilobytes.
+    - The count, mean and sum of squared deviations per group are merged with
+      those of every chunk (Welford/Chan), so the values themselves are never
+      kept.
+The memory use only depends on the chunk size and the amount of groups, not
+on the amount of matches, tiers or tours that are read.
+"""
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 100_000
+
+
+class SeenBitset:
+    """
+    Per group a bitset of the ids that were seen in that group.
+    """
+
+    def __init__(self):
+        self.bits = {}
+
+    def add(self, group, ids):
+        """
+        Marks ids as seen in group. Returns a mask that is True for the first
+        occurrence of every id that had not been seen in group before.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        mask = np.zeros(len(ids), dtype=bool)
+        if len(ids) == 0:
+            return mask
+        if ids.min() < 0:
+            raise ValueError("The ids have to be non-negative integers.")
+        unique, first = np.unique(ids, return_index=True)
+
+        bits = self.bits.get(group, np.zeros(0, dtype=np.uint8))
+        needed = int(unique[-1]) // 8 + 1
+        if len(bits) < needed:
+            # Grown with some room to spare, so it is not resized every chunk.
+            bits = np.concatenate([bits, np.zeros(max(needed - len(bits), needed // 4),
+                                                  dtype=np.uint8)])
+        byte = unique >> 3
+        bit = (1 << (unique & 7)).astype(np.uint8)
+        new = (bits[byte] & bit) == 0
+        # Several ids can share a byte, which np.bitwise_or.at handles unlike
+        # a |= with fancy indexing.
+        np.bitwise_or.at(bits, byte[new], bit[new])
+        self.bits[group] = bits
+
+        mask[first[new]] = True
+        return mask
+
+
+class GroupedWelford:
+    """
+    Running count, mean and sum of squared deviations (M2) per group.
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def update(self, group, values):
+        values = np.asarray(values, dtype=float)
+        n_b = len(values)
+        if n_b == 0:
+            return
+        mean_b = values.mean()
+        m2_b = ((values - mean_b) ** 2).sum()
+        n_a, mean_a, m2_a = self.stats.get(group, (0, 0.0, 0.0))
+        # Chan et al.'s way of combining two sets of statistics.
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        self.stats[group] = (
+            n,
+            mean_a + delta * n_b / n,
+            m2_a + m2_b + delta * delta * n_a * n_b / n,
+        )
+
+    def table(self, group_cols):
+        rows = []
+        for group, (n, mean, m2) in self.stats.items():
+            row = dict(zip(group_cols, group))
+            row.update({"n": n, "mean": mean, "std": np.sqrt(m2 / (n - 1)) if n > 1 else np.nan})
+            rows.append(row)
+        return pd.DataFrame(rows, columns=[*group_cols, "n", "mean", "std"])
+
+
+def streaming_player_stats(path, value, group_cols=("year", "tier"), chunksize=CHUNK_SIZE):
+    """
+    path - str
+        A csv with winner_id, loser_id, winner_{value}, loser_{value} and the
+        group_cols per match.
+    value - str
+        e.g. "age" or "ht".
+    group_cols - tuple
+        The columns that define a group.
+
+    Returns a DataFrame with the group_cols, n, mean and std per group, the
+    same as stacking the winners and losers, dropping the duplicates of
+    (group_cols, id) and aggregating. So every player counts once per group,
+    with the value of their first match as a winner if they won a match in
+    that group, else of their first match as a loser. To keep that order the
+    file is read twice, once for the winners and once for the losers.
+    """
+    group_cols = list(group_cols)
+    seen = SeenBitset()
+    stats = GroupedWelford()
+
+    for side in ["winner", "loser"]:
+        usecols = [*group_cols, f"{side}_id", f"{side}_{value}"]
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+            ids = chunk[f"{side}_id"].to_numpy()
+            values = chunk[f"{side}_{value}"].to_numpy(dtype=float)
+            for group, idx in chunk.groupby(group_cols, sort=False).indices.items():
+                group = group if isinstance(group, tuple) else (group,)
+                new = seen.add(group, ids[idx])
+                stats.update(group, values[idx][new])
+
+    return stats.table(group_cols).sort_values(group_cols).reset_index(drop=True)